@@ -0,0 +1,481 @@
+"""仟美医疗项目登记系统 性能基准测试
+
+在无界面环境（QT_QPA_PLATFORM=offscreen）下对主窗口的关键路径计时，
+结果以 JSON 输出，便于在不同版本之间对比。
+
+用法：
+    python benchmark.py --rows 1000 100000 1000000 --output result.json
+    python benchmark.py --compare baseline.json result.json
+    python benchmark.py --memory --memory-rows 100000
+
+内存参考结果（--memory --memory-rows 100000，每行字节数）：
+    widget    RSS 6943，Python 堆 2936
+    columnar  RSS 1092，Python 堆 337
+"""
+import argparse
+import base64
+import contextlib
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad, unpad
+from PyQt5.QtCore import QT_VERSION_STR, PYQT_VERSION_STR
+from PyQt5.QtPrintSupport import QPrinter
+from PyQt5.QtSql import QSqlDatabase, QSqlQuery
+from PyQt5.QtWidgets import QApplication, QDialog, QMessageBox, QTableWidget, QTableWidgetItem
+
+import qianmei
+
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘"
+GIVEN_CHARS = "芳娜敏静丽艳娟霞秀英华玉兰萍红梅琳雪婷倩颖洁佳怡欣悦涛明强伟磊军勇杰"
+AREA_CODES = ["110101", "110105", "310104", "310115", "440103", "440305",
+              "330106", "320102", "510107", "420106", "610113", "370202"]
+PHONE_PREFIXES = ["130", "131", "135", "136", "138", "139", "150", "151",
+                  "158", "177", "180", "186", "188", "189", "199"]
+SERVICES = ["水光针", "热玛吉", "光子嫩肤", "玻尿酸填充", "皮秒祛斑", "双眼皮修复", "面部提升"]
+DIRECTORS = ["孙总", "蔡医生"]
+DEPARTMENTS = ["仟美医疗美容"]
+GENDERS = ["女", "女", "女", "男", "其他"]
+ID_FACTORS = [7, 9, 10, 5, 8, 4, 2, 1, 6, 3, 7, 9, 10, 5, 8, 4, 2]
+ID_CHECK_CODES = "10X98765432"
+
+DEFAULT_ROWS = [1000, 100000, 1000000]
+MEMORY_CASES = ["widget", "columnar", "columnar_plain"]
+
+
+def make_id_number(rng, gender):
+    """生成带合法校验码的18位身份证号，顺序码奇偶与性别一致"""
+    birth = datetime.date(1950, 1, 1) + datetime.timedelta(days=rng.randrange(20000))
+    seq = rng.randrange(100) * 10 + (rng.randrange(1, 10, 2) if gender == "男" else rng.randrange(0, 10, 2))
+    body = f"{rng.choice(AREA_CODES)}{birth:%Y%m%d}{seq:03d}"
+    total = sum(int(body[i]) * ID_FACTORS[i] for i in range(17))
+    return body + ID_CHECK_CODES[total % 11], birth
+
+
+def make_phone(rng):
+    """生成11位手机号"""
+    return rng.choice(PHONE_PREFIXES) + f"{rng.randrange(10 ** 8):08d}"
+
+
+def make_name(rng):
+    """生成2~3字中文姓名"""
+    return rng.choice(SURNAMES) + "".join(rng.choice(GIVEN_CHARS) for _ in range(rng.choice((1, 2, 2))))
+
+
+def generate_records(count, seed=20240101):
+    """生成指定数量的模拟登记记录（明文），同一 seed 结果可复现"""
+    rng = random.Random(seed)
+    start = datetime.datetime(2022, 1, 1, 9, 0)
+    for _ in range(count):
+        gender = rng.choice(GENDERS)
+        id_number, birth = make_id_number(rng, gender)
+        appointment = start + datetime.timedelta(days=rng.randrange(1460), minutes=rng.randrange(0, 600, 15))
+        yield {
+            "customer_name": make_name(rng),
+            "gender": gender,
+            "age": max(18, appointment.year - birth.year),
+            "id_number": id_number,
+            "phone": make_phone(rng),
+            "appointment_time": appointment.strftime("%Y-%m-%d %H:%M"),
+            "service_type": rng.choice(SERVICES),
+            "design_director": rng.choice(DIRECTORS),
+            "department": rng.choice(DEPARTMENTS),
+            "is_first_time": rng.randrange(2),
+            "amount": str(rng.randrange(5, 500) * 100),
+            "notes": rng.choice(["", "", "过敏体质", "需要麻醉", "老客户介绍"]),
+            "submit_time": (appointment - datetime.timedelta(days=rng.randrange(1, 30))).strftime("%Y-%m-%d %H:%M"),
+        }
+
+
+def encrypt(text):
+    """与主程序相同的加密方式"""
+    cipher = AES.new(qianmei.ENCRYPTION_KEY, AES.MODE_ECB)
+    return base64.b64encode(cipher.encrypt(pad(text.encode("utf-8"), AES.block_size))).decode("utf-8")
+
+
+def decrypt(text):
+    cipher = AES.new(qianmei.ENCRYPTION_KEY, AES.MODE_ECB)
+    return unpad(cipher.decrypt(base64.b64decode(text)), AES.block_size).decode("utf-8")
+
+
+def populate_db(path, count, seed=20240101, batch_size=10000):
+    """向 appointments 表批量写入模拟数据（加密方式与主程序一致）"""
+    conn = sqlite3.connect(path)
+    sql = """
+        INSERT INTO appointments
+        (customer_name, gender, age, id_number, phone,
+         appointment_time, service_type, design_director, department,
+         is_first_time, amount, notes, submit_time, id_suffix, phone_suffix)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    batch = []
+    with conn:
+        for record in generate_records(count, seed):
+            batch.append((
+                record["customer_name"], record["gender"], record["age"],
+                encrypt(record["id_number"]), encrypt(record["phone"]),
+                record["appointment_time"], record["service_type"], record["design_director"],
+                record["department"], record["is_first_time"], record["amount"],
+                record["notes"], record["submit_time"],
+                record["id_number"][-4:], record["phone"][-4:],
+            ))
+            if len(batch) >= batch_size:
+                conn.executemany(sql, batch)
+                batch.clear()
+        if batch:
+            conn.executemany(sql, batch)
+    conn.close()
+
+
+@contextlib.contextmanager
+def suppress_dialogs():
+    """屏蔽模态对话框，使交互路径可以在无人值守下执行"""
+    saved = {name: getattr(QMessageBox, name) for name in ("information", "warning", "critical", "question")}
+    saved_exec = qianmei.EditDialog.exec
+    QMessageBox.information = staticmethod(lambda *args, **kwargs: QMessageBox.Ok)
+    QMessageBox.warning = staticmethod(lambda *args, **kwargs: QMessageBox.Ok)
+    QMessageBox.critical = staticmethod(lambda *args, **kwargs: QMessageBox.Ok)
+    QMessageBox.question = staticmethod(lambda *args, **kwargs: QMessageBox.Yes)
+    qianmei.EditDialog.exec = lambda self: QDialog.Accepted
+    try:
+        yield
+    finally:
+        for name, func in saved.items():
+            setattr(QMessageBox, name, func)
+        qianmei.EditDialog.exec = saved_exec
+
+
+def measure(func, repeat):
+    """执行 repeat 次并返回每次耗时（秒）"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(rows, case, samples, unit="s", ops=1):
+    return {
+        "rows": rows,
+        "case": case,
+        "unit": unit,
+        "repeat": len(samples),
+        "min": min(samples) / ops,
+        "median": statistics.median(samples) / ops,
+        "mean": statistics.fmean(samples) / ops,
+    }
+
+
+def fill_form(window, record):
+    window.name_input.setText(record["customer_name"])
+    window.gender_combo.setCurrentText(record["gender"])
+    window.age_input.setValue(record["age"])
+    window.id_input.setText(record["id_number"])
+    window.phone_input.setText(record["phone"])
+    window.service_combo.setPlainText(record["service_type"])
+    window.designer_combo.setCurrentText(record["design_director"])
+    window.amount_input.setText(record["amount"])
+    window.notes_input.setPlainText(record["notes"])
+
+
+def run_micro(window, repeat, ops=10000):
+    """加解密与身份证校验的单次耗时"""
+    records = list(generate_records(ops, seed=7))
+    ids = [record["id_number"] for record in records]
+    encrypted = [window.encrypt(value) for value in ids]
+    results = []
+    for case, func in (
+            ("encrypt", lambda: [window.encrypt(value) for value in ids]),
+            ("decrypt", lambda: [window.decrypt(value) for value in encrypted]),
+            ("id_check", lambda: [window.id_check(value) for value in ids])):
+        results.append(summarize(ops, case, measure(func, repeat), unit="s/op", ops=ops))
+    return results
+
+
+def run_size(app, rows, repeat, workdir, first=False):
+    """在 rows 行数据规模下执行全部交互路径"""
+    db_dir = os.path.join(workdir, str(rows))
+    os.makedirs(db_dir, exist_ok=True)
+    os.chdir(db_dir)
+    results = []
+
+    # 先由主程序建表，再批量灌入数据
+    window = qianmei.AppointmentSystem()
+    if first:
+        results.extend(run_micro(window, repeat))
+    window.close()
+    window.db.close()
+    populate_db("qianmei.db", rows)
+
+    slow_repeat = 1 if rows >= 100000 else repeat
+    windows = []
+
+    def startup():
+        windows.append(qianmei.AppointmentSystem())
+        app.processEvents()
+
+    results.append(summarize(rows, "startup", measure(startup, 1)))
+    window = windows[-1]
+    window.backup_manager.stop_schedule()  # 定时备份和提醒会干扰计时
+    window.reminder_timer.stop()
+
+    results.append(summarize(rows, "load", measure(window.refresh_table, slow_repeat)))
+
+    def search():
+        window.search_input.blockSignals(True)
+        window.search_input.setText(SURNAMES[0])
+        window.search_input.blockSignals(False)
+        window.search_appointments()
+
+    results.append(summarize(rows, "search", measure(search, repeat)))
+
+    extra = generate_records(repeat * 3, seed=rows)
+    with suppress_dialogs():
+        # submit 为受理耗时（追加日志并刷盘）；insert 从直接触发写入计到后台写库完成，
+        # 不含 FLUSH_DELAY_MS 的合并等待
+        queue = window.submission_queue
+        submits, inserts = [], []
+        for _ in range(slow_repeat):
+            fill_form(window, next(extra))
+            start = time.perf_counter()
+            window.add_appointment()
+            submits.append(time.perf_counter() - start)
+            queue.flush_timer.stop()
+            start = time.perf_counter()
+            queue.flush()
+            while queue.pending:
+                app.processEvents()
+            inserts.append(time.perf_counter() - start)
+
+        results.append(summarize(rows, "submit", submits))
+        results.append(summarize(rows, "insert", inserts))
+        results.append(summarize(rows, "edit", measure(lambda: window.show_edit_dialog(0), slow_repeat)))
+
+        def delete():
+            window.appointment_table.selectRow(0)
+            window.delete_selected_row()
+
+        results.append(summarize(rows, "delete", measure(delete, slow_repeat)))
+
+    row_data = [window.table_model.cell_text(0, col) for col in range(window.table_model.columnCount())]
+    pdf_path = os.path.join(db_dir, "print.pdf")
+
+    def print_pdf():
+        printer = QPrinter(QPrinter.HighResolution)
+        printer.setOutputFormat(QPrinter.PdfFormat)
+        printer.setOutputFileName(pdf_path)
+        window.render_print_content(printer, row_data)
+
+    results.append(summarize(rows, "print_pdf", measure(print_pdf, repeat)))
+
+    window.close()
+    window.db.close()
+    return results
+
+
+def rss_bytes():
+    """当前进程常驻内存（读取 /proc，非 Linux 平台返回 None）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def build_widget_table(query):
+    """旧版做法：每个单元格一个 QTableWidgetItem，敏感列全部解密"""
+    table = QTableWidget()
+    table.setColumnCount(13)
+    while query.next():
+        row = table.rowCount()
+        table.insertRow(row)
+        for col in range(13):
+            value = query.value(col)
+            if col in qianmei.SENSITIVE_COLUMNS:
+                value = decrypt(value)
+            table.setItem(row, col, QTableWidgetItem(str(value)))
+    return table
+
+
+def build_result_model(query, masked):
+    model = qianmei.AppointmentTableModel(decrypt)
+    model.set_result(qianmei.AppointmentResultSet.from_query(query, masked, decrypt))
+    return model
+
+
+def run_memory_case(case, db_path):
+    """在独立进程中测量一种存储方式的每行内存占用"""
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    db = QSqlDatabase.addDatabase("QSQLITE")
+    db.setDatabaseName(db_path)
+    db.open()
+    sql = (f"SELECT {qianmei.LISTING_COLUMNS} FROM (SELECT *, 0 AS archived FROM main.appointments) "
+           f"ORDER BY appointment_time")
+
+    def build():
+        query = QSqlQuery(sql)
+        if case == "widget":
+            holder = build_widget_table(query)
+        else:
+            holder = build_result_model(query, masked=case == "columnar")
+        query.finish()
+        return holder
+
+    # 常驻内存（含 Qt 的 C++ 对象），不开启 tracemalloc 以免干扰
+    gc.collect()
+    before = rss_bytes()
+    holder = build()
+    gc.collect()
+    after = rss_bytes()
+    rows = holder.rowCount()
+    del holder
+    gc.collect()
+
+    # Python 堆（tracemalloc 只统计 Python 分配）
+    tracemalloc.start()
+    holder = build()
+    gc.collect()
+    traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    db.close()
+    app.processEvents()
+    return {
+        "case": case,
+        "rows": rows,
+        "rss_bytes_per_row": (after - before) / rows if rows and before is not None else None,
+        "python_bytes_per_row": traced / rows if rows else None,
+    }
+
+
+def run_memory(rows):
+    """生成 rows 行数据，分别在子进程中测量各存储方式"""
+    cwd = os.getcwd()
+    results = []
+    with tempfile.TemporaryDirectory(prefix="qianmei-mem-") as workdir:
+        app = QApplication.instance() or QApplication(sys.argv[:1])
+        os.chdir(workdir)
+        try:
+            window = qianmei.AppointmentSystem()
+            window.close()
+            window.db.close()
+            app.processEvents()
+            populate_db("qianmei.db", rows)
+            db_path = os.path.join(workdir, "qianmei.db")
+            for case in MEMORY_CASES:
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--memory-case", case, "--db", db_path],
+                    capture_output=True, text=True, check=True, cwd=cwd
+                ).stdout
+                results.append(json.loads(output))
+                print(f"完成 {case}", file=sys.stderr)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report_meta(repeat):
+    return {
+        "revision": git_revision(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "qt": QT_VERSION_STR,
+        "pyqt": PYQT_VERSION_STR,
+        "platform": platform.platform(),
+        "repeat": repeat,
+    }
+
+
+def run(rows_list, repeat):
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    cwd = os.getcwd()
+    results = []
+    with tempfile.TemporaryDirectory(prefix="qianmei-bench-") as workdir:
+        try:
+            for index, rows in enumerate(rows_list):
+                results.extend(run_size(app, rows, repeat, workdir, first=index == 0))
+                print(f"完成 {rows} 行", file=sys.stderr)
+        finally:
+            os.chdir(cwd)
+    return {"meta": report_meta(repeat), "results": results}
+
+
+def compare(baseline_path, current_path, threshold):
+    """对比两次结果，中位数变慢超过阈值的项目视为回归"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["rows"], r["case"]): r for r in json.load(f)["results"]}
+    with open(current_path, encoding="utf-8") as f:
+        current = json.load(f)["results"]
+
+    regressions = 0
+    print(f"{'rows':>8} {'case':<10} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for result in current:
+        old = baseline.get((result["rows"], result["case"]))
+        if not old or not old["median"]:
+            continue
+        ratio = result["median"] / old["median"]
+        flag = ""
+        if ratio > threshold:
+            regressions += 1
+            flag = "  <-- 回归"
+        print(f"{result['rows']:>8} {result['case']:<10} {old['median']:>12.6f} {result['median']:>12.6f} "
+              f"{ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="仟美登记系统性能基准测试")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="数据规模（行数）")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数")
+    parser.add_argument("--output", help="结果 JSON 输出路径，默认输出到标准输出")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="对比两份结果")
+    parser.add_argument("--threshold", type=float, default=1.10, help="判定回归的耗时比例")
+    parser.add_argument("--memory", action="store_true", help="测量表格数据每行内存占用")
+    parser.add_argument("--memory-rows", type=int, default=100000, help="内存测量的数据规模")
+    parser.add_argument("--memory-case", choices=MEMORY_CASES, help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    if args.memory_case:
+        print(json.dumps(run_memory_case(args.memory_case, args.db)))
+        return
+
+    if args.memory:
+        report = {"meta": report_meta(1), "memory": run_memory(args.memory_rows)}
+    else:
+        report = run(args.rows, args.repeat)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
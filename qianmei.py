@@ -1,19 +1,1113 @@
+import abc
 import base64
+import contextlib
+import cProfile
+import glob
+import gzip
+import io
+import json
+import os
+import pstats
 import re
+import shutil
+import sqlite3
+import string
 import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from array import array
+from collections import OrderedDict, deque
 
 from Crypto.Cipher import AES
-from PyQt5.QtCore import Qt, QDateTime, QTimer, QSize, QRectF
+from PyQt5.QtCore import (Qt, QDateTime, QTimer, QSize, QRectF, QObject, QThread, pyqtSignal, pyqtSlot,
+                          QAbstractTableModel, QModelIndex, QDate, QTime)
 from PyQt5.QtPrintSupport import QPrinter, QPrintPreviewDialog, QPrintPreviewWidget
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QAction, QFileDialog,
                              QGroupBox, QFormLayout, QLineEdit, QDateTimeEdit, QComboBox,
-                             QTextEdit, QPushButton, QTableWidget, QTableWidgetItem,
+                             QTextEdit, QPushButton, QTableWidget, QTableWidgetItem, QTableView,
                              QHeaderView, QMessageBox, QSpinBox,
-                             QCheckBox, QDialog, QLabel, QGraphicsDropShadowEffect, QMenu)
+                             QCheckBox, QDialog, QLabel, QGraphicsDropShadowEffect, QMenu, QInputDialog)
 from PyQt5.QtSql import QSqlDatabase, QSqlQuery
 from PyQt5.QtGui import QFont, QColor, QIcon, QPainter
 from Crypto.Util.Padding import pad, unpad
 
+ENCRYPTION_KEY = b'thisisasecretkey'  # 16字节密钥（示例，实际应安全存储）
+
+DB_FILE = "qianmei.db"
+PENDING_JOURNAL = "qianmei_pending.jsonl"  # 待写入登记的追加日志
+FLUSH_DELAY_MS = 200  # 受理后等待合并写入的时间
+FLUSH_BATCH_SIZE = 200  # 每个写入事务的最大记录数
+FLUSH_RETRY_MAX_MS = 30000  # 写入失败后的最长重试间隔
+
+BACKUP_DIR = "backups"
+BACKUP_INTERVAL_MS = 6 * 3600 * 1000  # 定时备份间隔
+BACKUP_KEEP = 10  # 保留的快照数量
+BACKUP_PAGES_PER_STEP = 256  # 在线备份每步复制的页数
+BACKUP_COMPRESS = True  # 快照是否 gzip 压缩
+
+ARCHIVE_DB = "qianmei_archive.db"  # 历史预约归档库
+ARCHIVE_HORIZON_DAYS = 180  # 默认归档早于此天数的预约
+ARCHIVE_BATCH_SIZE = 500  # 每个事务迁移的记录数
+
+# appointments 表的全部字段（归档迁移时按此顺序显式列出）
+APPOINTMENT_COLUMNS = [
+    "id", "customer_name", "gender", "age", "id_number", "phone",
+    "appointment_time", "service_type", "design_director", "department",
+    "is_first_time", "amount", "notes", "submit_time",
+]
+
+# 后续版本新增的字段，旧库启动时通过 ALTER TABLE 补齐
+EXTRA_COLUMNS = [
+    ("submission_key", "TEXT"),  # 登记受理编号，保证日志重放不重复写入
+    ("id_suffix", "TEXT"),  # 身份证号后4位（明文，仅用于脱敏显示）
+    ("phone_suffix", "TEXT"),  # 联系电话后4位（明文，仅用于脱敏显示）
+    ("reminder_sent_at", "TEXT"),  # 预约提醒发送时间，为空表示未发送
+]
+APPOINTMENT_COLUMNS += [name for name, _ in EXTRA_COLUMNS]
+
+# 列表查询字段：前13列对应表格列，其后为归档标记和脱敏尾号
+LISTING_COLUMNS = """
+    id, customer_name, gender, age, id_number,
+    phone, strftime('%Y-%m-%d %H:%M', appointment_time),
+    service_type, design_director, department,
+    is_first_time, amount, notes, archived, id_suffix, phone_suffix
+"""
+SENSITIVE_COLUMNS = {4: 18, 5: 11}  # 敏感列 -> 明文长度
+
+HISTORY_RETENTION_DAYS = 365  # 早于此天数的变更历史压缩为每条记录一个版本
+HISTORY_COLUMNS = APPOINTMENT_COLUMNS[1:]  # 历史表保存的记录快照字段
+AUDITED_COLUMNS = APPOINTMENT_COLUMNS[1:14]  # 这些字段变化时才记录修改历史（不含派生的尾号等）
+HISTORY_OPS = {"I": "新增", "U": "修改", "D": "删除", "A": "归档"}
+
+REMINDER_TEMPLATE = "$name您好，您预约的$service将于$time在$department进行（$director），如需改期请提前联系我们。"
+REMINDER_SENDER = None  # 正式短信发送器（ReminderSender 子类实例），未配置时不定时发送提醒
+REMINDER_OUTBOX = "reminders_outbox.txt"  # 调试菜单中提醒预览的输出文件
+REMINDER_MIN_INTERVAL = 1.0  # 两条提醒之间的最小间隔（秒）
+REMINDER_RETRIES = 3  # 单条提醒的最大重试次数
+REMINDER_RETRY_DELAY = 2.0  # 首次重试前的等待（秒），之后翻倍
+REMINDER_CHECK_INTERVAL_MS = 3600 * 1000  # 定时检查明日提醒的间隔
+# 预约时间改动后清除已提醒标记，改期的预约会重新收到提醒
+REMINDER_RESET_TRIGGER = """
+    CREATE TRIGGER main.appointments_reminder_reset AFTER UPDATE OF appointment_time ON appointments
+    WHEN OLD.appointment_time IS NOT NEW.appointment_time AND NEW.reminder_sent_at IS NOT NULL
+    BEGIN
+        UPDATE appointments SET reminder_sent_at = NULL WHERE id = NEW.id;
+    END
+"""
+SUFFIX_LENGTH = 4
+UNDECRYPTABLE_TEXT = "无法解密"  # 密文损坏或密钥不符时的显示内容
+
+
+class _Span:
+    """一次计时区间"""
+    __slots__ = ("owner", "name", "start")
+
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.owner.record(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+class Instrumentation:
+    """性能监测：热点路径计时、计数器，以及可选的 cProfile / tracemalloc 采集
+
+    默认关闭，关闭时 span() 返回空上下文，几乎没有额外开销。
+    """
+    NULL_SPAN = contextlib.nullcontext()
+
+    def __init__(self, max_events=100000):
+        self.enabled = os.environ.get("QIANMEI_PROFILE") == "1"
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.spans = {}      # 名称 -> [次数, 总耗时, 最大耗时]
+        self.counters = {}
+        self.events = deque(maxlen=max_events)  # Chrome trace 事件，超出后丢弃最旧的
+        self.profiler = None
+        self.profile_report = ""
+        self.memory_report = ""
+
+    def span(self, name):
+        """计时区间，用法：with instrumentation.span("db.query"): ..."""
+        if not self.enabled:
+            return self.NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name, start, duration):
+        with self.lock:
+            stat = self.spans.get(name)
+            if stat is None:
+                self.spans[name] = [1, duration, duration]
+            else:
+                stat[0] += 1
+                stat[1] += duration
+                if duration > stat[2]:
+                    stat[2] = duration
+            self.events.append((name, start - self.origin, duration, threading.get_ident()))
+
+    def count(self, name, amount=1):
+        """累加计数器"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        with self.lock:
+            self.spans.clear()
+            self.counters.clear()
+            self.events.clear()
+            self.origin = time.perf_counter()
+
+    def start_profile(self):
+        """开始 cProfile 采集"""
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop_profile(self, limit=30):
+        """停止 cProfile 采集并生成累计耗时排行"""
+        if self.profiler is None:
+            return self.profile_report
+        self.profiler.disable()
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+        self.profiler = None
+        self.profile_report = stream.getvalue()
+        return self.profile_report
+
+    def start_tracemalloc(self):
+        """开始内存分配跟踪"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop_tracemalloc(self, limit=20):
+        """停止内存分配跟踪并生成按代码行统计的排行"""
+        if not tracemalloc.is_tracing():
+            return self.memory_report
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        lines = [f"当前: {current / 1024:.1f} KiB  峰值: {peak / 1024:.1f} KiB"]
+        lines.extend(str(stat) for stat in snapshot.statistics("lineno")[:limit])
+        self.memory_report = "\n".join(lines)
+        return self.memory_report
+
+    def snapshot(self):
+        """汇总数据，供诊断面板与导出使用"""
+        with self.lock:
+            spans = {
+                name: {"count": count, "total_ms": total * 1000, "avg_ms": total * 1000 / count, "max_ms": peak * 1000}
+                for name, (count, total, peak) in self.spans.items()
+            }
+            return {"spans": spans, "counters": dict(self.counters)}
+
+    def export_json(self, path):
+        data = self.snapshot()
+        data["profile"] = self.profile_report
+        data["tracemalloc"] = self.memory_report
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def export_chrome_trace(self, path):
+        """导出为 Chrome trace 格式（chrome://tracing 或 Perfetto 打开）"""
+        with self.lock:
+            events = [
+                {"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6, "pid": os.getpid(), "tid": tid}
+                for name, start, duration, tid in self.events
+            ]
+            counters = dict(self.counters)
+        if counters:
+            events.append({"name": "counters", "ph": "C", "ts": 0, "pid": os.getpid(), "args": counters})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+instrumentation = Instrumentation()
+
+
+class BackupCancelled(Exception):
+    pass
+
+
+def backup_database(source_path, target_path, pages=BACKUP_PAGES_PER_STEP, progress=None):
+    """使用 SQLite 在线备份接口按页分步复制数据库"""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=pages, progress=progress)
+    finally:
+        target.close()
+        source.close()
+
+
+def verify_database(path):
+    """完整性检查，返回 (是否通过, 预约记录数或错误信息)"""
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            if result != "ok":
+                return False, result
+            return True, conn.execute("SELECT COUNT(*) FROM appointments").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        return False, str(e)
+
+
+@contextlib.contextmanager
+def open_snapshot(path):
+    """得到快照的可读路径，压缩快照先解压到临时文件"""
+    if not path.endswith(".gz"):
+        yield path
+        return
+    fd, temp_path = tempfile.mkstemp(suffix=".db")
+    try:
+        with os.fdopen(fd, "wb") as out, gzip.open(path, "rb") as src:
+            shutil.copyfileobj(src, out)
+        yield temp_path
+    finally:
+        os.remove(temp_path)
+
+
+def write_snapshot(source_path, path, progress=None):
+    """在线备份 source_path 到 path，校验通过后按配置压缩，返回最终文件路径"""
+    part = path + ".part"
+    try:
+        backup_database(source_path, part, progress=progress)
+        ok, detail = verify_database(part)
+        if not ok:
+            raise RuntimeError(f"快照校验失败: {detail}")
+        if BACKUP_COMPRESS:
+            with open(part, "rb") as src, gzip.open(path + ".gz", "wb") as out:
+                shutil.copyfileobj(src, out)
+            os.remove(part)
+            return path + ".gz"
+        os.replace(part, path)
+        return path
+    except BaseException:
+        remove_quietly(part)
+        raise
+
+
+def take_snapshot(db_path, archive_path, backup_dir, name, progress=None):
+    """为主库和归档库成对生成快照，返回主库快照路径"""
+    os.makedirs(backup_dir, exist_ok=True)
+    path = write_snapshot(db_path, os.path.join(backup_dir, f"qianmei-{name}.db"), progress)
+    if os.path.exists(archive_path):
+        try:
+            write_snapshot(archive_path, os.path.join(backup_dir, f"qianmei_archive-{name}.db"), progress)
+        except BaseException:
+            remove_quietly(path)
+            raise
+    return path
+
+
+def archive_snapshot_paths(snapshot):
+    """主库快照对应的归档库快照可能的路径（未压缩、压缩）"""
+    directory, name = os.path.split(snapshot)
+    if name.endswith(".gz"):
+        name = name[:-len(".gz")]
+    path = os.path.join(directory, "qianmei_archive-" + name[len("qianmei-"):])
+    return path, path + ".gz"
+
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class BackupWorker(QObject):
+    """后台线程中执行在线备份、校验、压缩和轮转"""
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, db_path, archive_path, backup_dir):
+        super().__init__()
+        self.db_path = db_path
+        self.archive_path = archive_path
+        self.backup_dir = backup_dir
+        self.cancelled = False
+
+    def on_progress(self, status, remaining, total):
+        if self.cancelled:
+            raise BackupCancelled()
+        if total:
+            self.progress.emit(int((total - remaining) * 100 / total))
+        time.sleep(0.001)  # 每步之间让出数据库锁，避免阻塞写入
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            with instrumentation.span("backup.copy"):
+                path = take_snapshot(self.db_path, self.archive_path, self.backup_dir,
+                                     time.strftime('%Y%m%d-%H%M%S'), progress=self.on_progress)
+            rotate_snapshots(self.backup_dir)
+        except BackupCancelled:
+            return
+        except (sqlite3.Error, OSError, RuntimeError) as e:
+            self.failed.emit(str(e))
+            return
+        self.finished.emit(path)
+
+
+def list_snapshots(backup_dir):
+    """按时间倒序列出主库快照文件（含恢复前自动保存的快照）"""
+    paths = glob.glob(os.path.join(backup_dir, "qianmei-*.db")) + glob.glob(os.path.join(backup_dir, "qianmei-*.db.gz"))
+    return sorted(paths, reverse=True)
+
+
+def rotate_snapshots(backup_dir):
+    """只保留最近 BACKUP_KEEP 份快照，归档库快照随主库快照一起删除"""
+    for old in list_snapshots(backup_dir)[BACKUP_KEEP:]:
+        remove_quietly(old)
+        for path in archive_snapshot_paths(old):
+            remove_quietly(path)
+
+
+class BackupManager(QObject):
+    """定时在线备份，并提供校验与恢复"""
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(str)
+    failed = pyqtSignal(str)
+    run_requested = pyqtSignal()
+
+    def __init__(self, db_path, archive_path, backup_dir, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.archive_path = archive_path
+        self.backup_dir = backup_dir
+        self.running = False
+
+        self.thread = QThread(self)
+        self.worker = BackupWorker(db_path, archive_path, backup_dir)
+        self.worker.moveToThread(self.thread)
+        self.run_requested.connect(self.worker.run)
+        self.worker.progress.connect(self.progress)
+        self.worker.finished.connect(self.on_finished)
+        self.worker.failed.connect(self.on_failed)
+        self.thread.start()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.start_backup)
+        self.timer.start(BACKUP_INTERVAL_MS)
+
+        # 距上次备份已超过间隔时，启动一分钟后补做一次
+        self.catch_up_timer = QTimer(self)
+        self.catch_up_timer.setSingleShot(True)
+        self.catch_up_timer.timeout.connect(self.start_backup)
+        snapshots = list_snapshots(backup_dir)
+        if not snapshots or time.time() - os.path.getmtime(snapshots[0]) > BACKUP_INTERVAL_MS / 1000:
+            self.catch_up_timer.start(60000)
+
+    def start_backup(self):
+        if self.running:
+            return False
+        self.running = True
+        self.run_requested.emit()
+        return True
+
+    def on_finished(self, path):
+        self.running = False
+        self.finished.emit(path)
+
+    def on_failed(self, message):
+        self.running = False
+        self.failed.emit(message)
+
+    def snapshots(self):
+        return list_snapshots(self.backup_dir)
+
+    def verify(self, snapshot):
+        """校验快照（有归档库快照时一并校验），返回 (是否通过, 预约记录数或错误信息)"""
+        try:
+            with open_snapshot(snapshot) as path:
+                ok, detail = verify_database(path)
+            archive_snapshot = self.archive_snapshot(snapshot)
+            if ok and archive_snapshot:
+                with open_snapshot(archive_snapshot) as path:
+                    archive_ok, archive_detail = verify_database(path)
+                if not archive_ok:
+                    return False, f"归档库快照: {archive_detail}"
+            return ok, detail
+        except OSError as e:
+            return False, str(e)
+
+    def archive_snapshot(self, snapshot):
+        """快照对应的归档库快照，不存在时返回 None"""
+        for path in archive_snapshot_paths(snapshot):
+            if os.path.exists(path):
+                return path
+        return None
+
+    def restore(self, snapshot):
+        """先为当前数据留一份快照，再用在线备份接口把主库和归档库快照成对写回
+
+        返回恢复前快照的路径。旧快照没有归档库部分时只恢复主库，
+        调用方需要处理主库与归档库的重复记录。
+        """
+        safety = take_snapshot(self.db_path, self.archive_path, self.backup_dir,
+                               f"{time.strftime('%Y%m%d-%H%M%S')}-before-restore")
+        with open_snapshot(snapshot) as path:
+            backup_database(path, self.db_path)
+        archive_snapshot = self.archive_snapshot(snapshot)
+        if archive_snapshot:
+            with open_snapshot(archive_snapshot) as path:
+                backup_database(path, self.archive_path)
+        rotate_snapshots(self.backup_dir)
+        return safety
+
+    def stop_schedule(self):
+        self.timer.stop()
+        self.catch_up_timer.stop()
+
+    def shutdown(self):
+        self.stop_schedule()
+        self.worker.cancelled = True
+        self.thread.quit()
+        self.thread.wait()
+
+
+class ReminderError(Exception):
+    """提醒发送失败（可重试）"""
+
+
+class ReminderSender(abc.ABC):
+    """提醒发送接口，子类实现 send()，失败时抛出 ReminderError
+
+    stand_in 为真的发送器只用于预览，发送成功也不标记为已提醒。
+    """
+    stand_in = False
+
+    @abc.abstractmethod
+    def send(self, phone, message):
+        """发送一条提醒"""
+
+
+class FileReminderSender(ReminderSender):
+    """本地替身：把提醒写入文件，path 为 None 时写到标准输出"""
+    stand_in = True
+
+    def __init__(self, path=None):
+        self.path = path
+
+    def send(self, phone, message):
+        line = f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{phone}\t{message}\n"
+        try:
+            if self.path is None:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            else:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+        except OSError as e:
+            raise ReminderError(str(e))
+
+
+class ReminderJob:
+    """预约提醒批处理
+
+    按 appointment_time 索引取出时间段内尚未提醒的预约，只解密这些记录的电话，
+    按模板生成消息后限速发送；每条发送成功立即写入 reminder_sent_at，
+    重复运行只会处理未发送的记录。替身发送器只预览，不写入 reminder_sent_at。
+    """
+    def __init__(self, db, decrypt, sender, template=REMINDER_TEMPLATE,
+                 min_interval=REMINDER_MIN_INTERVAL, retries=REMINDER_RETRIES, sleep=time.sleep):
+        self.db = db
+        self.decrypt = decrypt
+        self.sender = sender
+        self.template = string.Template(template)
+        self.min_interval = min_interval
+        self.retries = retries
+        self.sleep = sleep
+        self.last_sent = 0.0
+        self.cancelled = False
+
+    def due(self, start, end):
+        """[start, end) 内未提醒的预约，返回 (记录列表, 电话无法解密而跳过的条数)"""
+        query = QSqlQuery(self.db)
+        query.prepare("""
+            SELECT id, customer_name, phone, strftime('%Y-%m-%d %H:%M', appointment_time),
+                   service_type, design_director, department
+            FROM appointments
+            WHERE appointment_time >= ? AND appointment_time < ? AND reminder_sent_at IS NULL
+            ORDER BY appointment_time
+        """)
+        query.addBindValue(start)
+        query.addBindValue(end)
+        rows = []
+        with instrumentation.span("db.query"):
+            if not query.exec():
+                raise RuntimeError(query.lastError().text())
+            while query.next():
+                rows.append([query.value(col) for col in range(7)])
+        due = []
+        with instrumentation.span("crypto.decrypt_batch"):
+            for row in rows:
+                try:
+                    row[2] = self.decrypt(row[2])
+                except (ValueError, TypeError):
+                    continue
+                due.append(row)
+        return due, len(rows) - len(due)
+
+    def render(self, row):
+        record_id, name, phone, appointment_time, service, director, department = row
+        return self.template.safe_substitute(
+            name=name, phone=phone, time=appointment_time, service=service,
+            director=director, department=department
+        )
+
+    def wait(self, seconds, step=0.1):
+        """分段等待，取消时立即返回 False"""
+        while seconds > 0:
+            if self.cancelled:
+                return False
+            self.sleep(min(step, seconds))
+            seconds -= step
+        return not self.cancelled
+
+    def send(self, phone, message):
+        """限速发送，失败按指数退避重试，等待期间可取消"""
+        delay = REMINDER_RETRY_DELAY
+        for attempt in range(self.retries + 1):
+            if not self.wait(self.last_sent + self.min_interval - time.monotonic()):
+                return False
+            self.last_sent = time.monotonic()
+            try:
+                self.sender.send(phone, message)
+                return True
+            except ReminderError:
+                if attempt == self.retries or not self.wait(delay):
+                    return False
+                delay *= 2
+        return False
+
+    def mark_sent(self, record_id):
+        query = QSqlQuery(self.db)
+        query.prepare("UPDATE appointments SET reminder_sent_at = ? WHERE id = ? AND reminder_sent_at IS NULL")
+        query.addBindValue(QDateTime.currentDateTime().toString("yyyy-MM-dd HH:mm:ss"))
+        query.addBindValue(record_id)
+        return query.exec()
+
+    def run(self, start, end, progress=None):
+        """发送 [start, end) 内的提醒，返回 (成功数, 失败数)"""
+        rows, failed = self.due(start, end)
+        total = len(rows) + failed
+        sent = 0
+        for row in rows:
+            if self.cancelled:
+                break
+            if self.send(row[2], self.render(row)) and (self.sender.stand_in or self.mark_sent(row[0])):
+                sent += 1
+            else:
+                failed += 1
+            if progress is not None:
+                progress(sent + failed, total)
+        return sent, failed
+
+
+class ReminderWorker(QObject):
+    """在后台线程中运行提醒批处理（使用独立连接）"""
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+
+    CONNECTION_NAME = "qianmei_reminder"
+
+    def __init__(self, db_path, decrypt, sender, preview_sender):
+        super().__init__()
+        self.db_path = db_path
+        self.decrypt = decrypt
+        self.sender = sender
+        self.preview_sender = preview_sender
+        self.db = None
+        self.job = None
+
+    @pyqtSlot(str, str, bool)
+    def run(self, start, end, preview):
+        if self.db is None:
+            self.db = QSqlDatabase.addDatabase("QSQLITE", self.CONNECTION_NAME)
+            self.db.setDatabaseName(self.db_path)
+            self.db.setConnectOptions("QSQLITE_BUSY_TIMEOUT=5000")
+        if not self.db.isOpen() and not self.db.open():
+            self.failed.emit(self.db.lastError().text())
+            return
+        self.job = ReminderJob(self.db, self.decrypt, self.preview_sender if preview else self.sender)
+        try:
+            sent, failed = self.job.run(start, end, progress=self.progress.emit)
+        except RuntimeError as e:
+            self.failed.emit(str(e))
+            return
+        self.finished.emit(sent, failed)
+
+    def cancel(self):
+        job = self.job  # 可能与后台线程中的 close() 同时执行
+        if job is not None:
+            job.cancelled = True
+
+    def close(self):
+        self.job = None  # 批处理持有连接的引用，需先释放才能移除连接
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+            QSqlDatabase.removeDatabase(self.CONNECTION_NAME)
+
+
+class SubmissionWriter(QObject):
+    """在后台线程中把待写入登记合并写入数据库（使用独立连接）"""
+    written = pyqtSignal(list)
+    failed = pyqtSignal(list, str)
+
+    CONNECTION_NAME = "qianmei_writer"
+
+    def __init__(self, db_path):
+        super().__init__()
+        self.db_path = db_path
+        self.db = None
+
+    def open(self):
+        if self.db is None:
+            self.db = QSqlDatabase.addDatabase("QSQLITE", self.CONNECTION_NAME)
+            self.db.setDatabaseName(self.db_path)
+            self.db.setConnectOptions("QSQLITE_BUSY_TIMEOUT=5000")
+        return self.db.isOpen() or self.db.open()
+
+    @pyqtSlot(list)
+    def write(self, entries):
+        """一个事务写入一组登记，entries 为 [(受理编号, 字段字典), ...]"""
+        keys = [key for key, _ in entries]
+        if not self.open():
+            self.failed.emit(keys, self.db.lastError().text())
+            return
+
+        with instrumentation.span("db.insert"):
+            self.db.transaction()
+            error = None
+            query = QSqlQuery(self.db)
+            prepared = None
+            for key, record in entries:
+                columns = tuple(record) + ("submission_key",)
+                if columns != prepared:
+                    query.prepare(
+                        f"INSERT OR IGNORE INTO appointments ({', '.join(columns)}) "
+                        f"VALUES ({', '.join('?' * len(columns))})"
+                    )
+                    prepared = columns
+                for value in record.values():
+                    query.addBindValue(value)
+                query.addBindValue(key)
+                if not query.exec():
+                    error = query.lastError().text()
+                    break
+            if error is None and not self.db.commit():
+                error = self.db.lastError().text()
+            if error is not None:
+                self.db.rollback()
+                self.failed.emit(keys, error)
+                return
+        self.written.emit(keys)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+            QSqlDatabase.removeDatabase(self.CONNECTION_NAME)
+
+
+class SubmissionQueue(QObject):
+    """登记提交队列
+
+    受理的登记先追加到本地日志并刷盘，再由后台线程合并写入 SQLite；
+    程序异常退出后，启动时重放日志中未确认写入的记录。
+    """
+    pending_changed = pyqtSignal(int)
+    flushed = pyqtSignal(int)
+    flush_failed = pyqtSignal(str)
+    write_requested = pyqtSignal(list)
+
+    def __init__(self, journal_path, db_path, parent=None):
+        super().__init__(parent)
+        self.journal_path = journal_path
+        self.pending = OrderedDict()  # 受理编号 -> 字段字典
+        self.in_flight = False
+        self.retry_delay = 0
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.timeout.connect(self.flush)
+
+        self.thread = QThread(self)
+        self.writer = SubmissionWriter(db_path)
+        self.writer.moveToThread(self.thread)
+        self.write_requested.connect(self.writer.write)
+        self.writer.written.connect(self.on_written)
+        self.writer.failed.connect(self.on_failed)
+        self.thread.finished.connect(self.writer.close, Qt.DirectConnection)
+        self.thread.start()
+
+    def append_journal(self, entry):
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def submit(self, record):
+        """受理一条登记：写入日志后立即返回，稍后合并写库"""
+        key = uuid.uuid4().hex
+        self.append_journal({"op": "add", "key": key, "record": record})
+        self.pending[key] = record
+        self.pending_changed.emit(len(self.pending))
+        if not self.flush_timer.isActive() and not self.retry_delay:
+            self.flush_timer.start(FLUSH_DELAY_MS)
+        return key
+
+    def replay(self):
+        """重放日志中尚未确认写入的记录，返回条数"""
+        if not os.path.exists(self.journal_path):
+            return 0
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # 写到一半的最后一行
+                if entry.get("op") == "add":
+                    self.pending[entry["key"]] = entry["record"]
+                elif entry.get("op") == "done":
+                    for key in entry["keys"]:
+                        self.pending.pop(key, None)
+        self.pending_changed.emit(len(self.pending))
+        if self.pending:
+            self.flush_timer.start(0)
+        else:
+            self.compact()
+        return len(self.pending)
+
+    def flush(self):
+        """把一批待写入登记交给后台线程"""
+        if self.in_flight or not self.pending:
+            return
+        entries = list(self.pending.items())[:FLUSH_BATCH_SIZE]
+        self.in_flight = True
+        self.write_requested.emit(entries)
+
+    def on_written(self, keys):
+        self.in_flight = False
+        self.retry_delay = 0
+        self.append_journal({"op": "done", "keys": keys})
+        for key in keys:
+            self.pending.pop(key, None)
+        if not self.pending:
+            self.compact()
+        self.pending_changed.emit(len(self.pending))
+        self.flushed.emit(len(keys))
+        if self.pending:
+            self.flush_timer.start(0)
+
+    def on_failed(self, keys, message):
+        self.in_flight = False
+        self.retry_delay = min(max(self.retry_delay * 2, 1000), FLUSH_RETRY_MAX_MS)
+        self.flush_failed.emit(message)
+        self.flush_timer.start(self.retry_delay)
+
+    def compact(self):
+        """全部写入后清空日志，避免无限增长"""
+        with open(self.journal_path, "w", encoding="utf-8"):
+            pass
+
+    def shutdown(self):
+        """停止后台写入；未写入的记录保留在日志中，下次启动时重放"""
+        self.flush_timer.stop()
+        self.thread.quit()
+        self.thread.wait()
+
+
+def decrypt_or_placeholder(decrypt, cipher_text):
+    """解密失败时返回 UNDECRYPTABLE_TEXT，单条坏数据不影响界面"""
+    try:
+        return decrypt(cipher_text)
+    except (ValueError, TypeError):
+        return UNDECRYPTABLE_TEXT
+
+
+class CategoryColumn:
+    """字典编码列：取值种类很少的列每行只存一个编号"""
+    __slots__ = ("values", "codes_by_value", "codes")
+
+    def __init__(self):
+        self.values = []
+        self.codes_by_value = {}
+        self.codes = array("H")
+
+    def append(self, value):
+        code = self.codes_by_value.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes_by_value[value] = code
+            self.values.append(value)
+        self.codes.append(code)
+
+    def __getitem__(self, row):
+        return self.values[self.codes[row]]
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class AppointmentResultSet:
+    """列表查询结果的紧凑列式存储
+
+    数值列使用 array，性别、设计总监、所属部门做字典编码，
+    其余文本使用 sys.intern 去重。脱敏模式下敏感列只保存密文和尾号。
+    """
+    NO_TIME = -1
+
+    def __init__(self, masked, decrypt):
+        self.masked = masked
+        self.decrypt = decrypt
+        self.ids = array("q")
+        self.ages = array("h")
+        self.times = array("q")  # yyyyMMddHHmm 形式的整数
+        self.first_flags = array("b")
+        self.archived = array("b")
+        self.amounts = array("q")
+        self.odd_amounts = {}  # 非整数金额：行 -> 原文
+        self.genders = CategoryColumn()
+        self.directors = CategoryColumn()
+        self.departments = CategoryColumn()
+        self.names = []
+        self.services = []
+        self.notes = []
+        self.id_numbers = []  # 脱敏模式为密文，否则为明文
+        self.phones = []
+        self.id_suffixes = []
+        self.phone_suffixes = []
+        self.revealed = {}  # 行 -> (身份证号, 联系电话) 明文
+
+    @classmethod
+    def from_query(cls, query, masked, decrypt):
+        """读取 LISTING_COLUMNS 查询的全部结果"""
+        result = cls(masked, decrypt)
+        while query.next():
+            result.append([query.value(col) for col in range(16)])
+        return result
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, values):
+        row = len(self.ids)
+        self.ids.append(int(values[0]))
+        self.names.append(self.text(values[1]))
+        self.genders.append(self.text(values[2]))
+        self.ages.append(int(values[3] or 0))
+        if self.masked:
+            self.id_numbers.append(values[4])
+            self.phones.append(values[5])
+        else:
+            self.id_numbers.append(self.plain(values[4]))
+            self.phones.append(self.plain(values[5]))
+        self.times.append(self.time_key(values[6]))
+        self.services.append(self.text(values[7]))
+        self.directors.append(self.text(values[8]))
+        self.departments.append(self.text(values[9]))
+        self.first_flags.append(1 if values[10] else 0)
+        amount = self.text(values[11])
+        if amount.isdigit() and len(amount) < 19:
+            self.amounts.append(int(amount))
+        else:
+            self.amounts.append(-1)
+            self.odd_amounts[row] = amount
+        self.notes.append(self.text(values[12]))
+        self.archived.append(1 if values[13] else 0)
+        self.id_suffixes.append(self.text(values[14]))
+        self.phone_suffixes.append(self.text(values[15]))
+
+    @staticmethod
+    def text(value):
+        return sys.intern(str(value)) if value is not None else ""
+
+    def plain(self, cipher_text):
+        return decrypt_or_placeholder(self.decrypt, cipher_text)
+
+    @classmethod
+    def time_key(cls, text):
+        """'yyyy-MM-dd HH:mm' -> yyyyMMddHHmm"""
+        if not text or len(text) < 16:
+            return cls.NO_TIME
+        try:
+            return int(text[0:4] + text[5:7] + text[8:10] + text[11:13] + text[14:16])
+        except ValueError:
+            return cls.NO_TIME
+
+    @classmethod
+    def format_time(cls, key):
+        if key == cls.NO_TIME:
+            return ""
+        return (f"{key // 100000000:04d}-{key // 1000000 % 100:02d}-{key // 10000 % 100:02d} "
+                f"{key // 100 % 100:02d}:{key % 100:02d}")
+
+    def amount(self, row):
+        value = self.amounts[row]
+        return self.odd_amounts.get(row, "") if value < 0 else str(value)
+
+    def sensitive(self, row, col, reveal=False):
+        """身份证号(4)/联系电话(5)；脱敏模式下除非 reveal 或已显示，否则返回掩码"""
+        index = 0 if col == 4 else 1
+        if not self.masked:
+            return (self.id_numbers, self.phones)[index][row]
+        if row in self.revealed:
+            return self.revealed[row][index]
+        if reveal:
+            return self.plain((self.id_numbers, self.phones)[index][row])
+        suffix = (self.id_suffixes, self.phone_suffixes)[index][row]
+        return "*" * (SENSITIVE_COLUMNS[col] - len(suffix)) + suffix
+
+    def reveal(self, row):
+        if self.masked and row not in self.revealed:
+            self.revealed[row] = (self.plain(self.id_numbers[row]), self.plain(self.phones[row]))
+
+    def display(self, row, col, reveal=False):
+        """表格显示文本"""
+        if col == 0:
+            return str(self.ids[row])
+        if col == 1:
+            return self.names[row]
+        if col == 2:
+            return self.genders[row]
+        if col == 3:
+            return str(self.ages[row])
+        if col in SENSITIVE_COLUMNS:
+            return self.sensitive(row, col, reveal)
+        if col == 6:
+            return self.format_time(self.times[row])
+        if col == 7:
+            return self.services[row]
+        if col == 8:
+            return self.directors[row]
+        if col == 9:
+            return self.departments[row]
+        if col == 10:
+            return "是" if self.first_flags[row] else "否"
+        if col == 11:
+            return self.amount(row)
+        return self.notes[row]
+
+    def sort_key(self, col):
+        """排序键：数值列按数值排序"""
+        numeric = {0: self.ids, 3: self.ages, 6: self.times, 10: self.first_flags, 11: self.amounts}
+        if col in numeric:
+            return numeric[col].__getitem__
+        return lambda row: self.display(row, col)
+
+
+class AppointmentTableModel(QAbstractTableModel):
+    """预约表格模型，数据来自 AppointmentResultSet"""
+    HEADERS = ["ID", "客户姓名", "性别", "年龄", "身份证号",
+               "联系电话", "预约时间", "项目", "设计总监",
+               "所属部门", "首次登记", "金额", "备注"]
+    ARCHIVED_COLOR = QColor("#adb5bd")
+    EXPIRED_COLOR = QColor("#ff6b6b")
+
+    def __init__(self, decrypt, parent=None):
+        super().__init__(parent)
+        self.result = AppointmentResultSet(True, decrypt)
+        self.decrypt = decrypt
+        self.order = array("l")  # 显示行 -> 存储行
+        self.sort_column = -1
+        self.sort_order = Qt.AscendingOrder
+        self.now_key = 0
+
+    def set_result(self, result):
+        self.beginResetModel()
+        self.result = result
+        self.order = array("l", range(len(result)))
+        self.now_key = int(QDateTime.currentDateTime().toString("yyyyMMddHHmm"))
+        if self.sort_column >= 0:
+            self.apply_sort()
+        self.endResetModel()
+
+    def clear(self):
+        self.set_result(AppointmentResultSet(self.result.masked, self.decrypt))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.order[index.row()]
+        col = index.column()
+        if role == Qt.DisplayRole:
+            return self.result.display(row, col)
+        if role == Qt.TextAlignmentRole and col == 11:  # 金额列右对齐
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role == Qt.ForegroundRole:
+            if col == 6 and self.is_expired(row):
+                return self.EXPIRED_COLOR
+            if self.result.archived[row]:
+                return self.ARCHIVED_COLOR
+        if role == Qt.ToolTipRole:
+            if self.result.archived[row]:
+                return "历史归档记录（只读）"
+            if col == 6 and self.is_expired(row):
+                return "已过期预约"
+        return None
+
+    def is_expired(self, row):
+        return self.result.times[row] < self.now_key
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        self.layoutAboutToBeChanged.emit()
+        self.apply_sort()
+        self.layoutChanged.emit()
+
+    def apply_sort(self):
+        with instrumentation.span("table.sort"):
+            self.order = array("l", sorted(
+                range(len(self.result)), key=self.result.sort_key(self.sort_column),
+                reverse=self.sort_order == Qt.DescendingOrder
+            ))
+
+    def record_id(self, row):
+        return self.result.ids[self.order[row]]
+
+    def is_archived(self, row):
+        return bool(self.result.archived[self.order[row]])
+
+    def cell_text(self, row, col):
+        """单元格的真实内容，脱敏单元格按需解密（不改变显示）"""
+        return self.result.display(self.order[row], col, reveal=True)
+
+    def reveal(self, row):
+        """显示某行的身份证号和联系电话明文"""
+        self.result.reveal(self.order[row])
+        self.dataChanged.emit(self.index(row, 4), self.index(row, 5))
+
 
 class EditDialog(QDialog):
     def __init__(self, data, parent=None):
@@ -171,14 +1265,244 @@ class EditDialog(QDialog):
         return check_code_map[total % 11] == id_number[-1].upper()
 
 
+class BulkAssignDialog(QDialog):
+    """批量修改设计总监 / 所属部门"""
+    def __init__(self, count, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"批量修改（{count} 条）")
+        self.setWindowIcon(QIcon("icon.png"))
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+        form_layout = QFormLayout()
+
+        self.designer_check = QCheckBox("设计总监：")
+        self.designer_combo = QComboBox()
+        self.designer_combo.addItems(["孙总", "蔡医生"])
+        self.dept_check = QCheckBox("所属部门：")
+        self.dept_combo = QComboBox()
+        self.dept_combo.addItems(["仟美医疗美容"])
+        form_layout.addRow(self.designer_check, self.designer_combo)
+        form_layout.addRow(self.dept_check, self.dept_combo)
+
+        btn_layout = QHBoxLayout()
+        self.save_btn = QPushButton("保存")
+        self.save_btn.clicked.connect(self.accept)
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.clicked.connect(self.reject)
+        btn_layout.addWidget(self.save_btn)
+        btn_layout.addWidget(self.cancel_btn)
+
+        layout.addLayout(form_layout)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+
+    def changes(self):
+        """勾选的字段 -> 新值"""
+        changes = {}
+        if self.designer_check.isChecked():
+            changes["design_director"] = self.designer_combo.currentText()
+        if self.dept_check.isChecked():
+            changes["department"] = self.dept_combo.currentText()
+        return changes
+
+
+class HistoryDialog(QDialog):
+    """变更记录：按时间段查询变更，或查看某条记录在指定时刻的状态"""
+    LABELS = {
+        "customer_name": "客户姓名", "appointment_time": "预约时间", "service_type": "项目",
+        "design_director": "设计总监", "department": "所属部门", "amount": "金额", "notes": "备注",
+    }
+
+    def __init__(self, system, record_id=None):
+        super().__init__(system)
+        self.system = system
+        self.record_id = record_id
+        self.setWindowTitle(f"修改历史 - 记录 {record_id}" if record_id is not None else "变更记录")
+        self.setWindowIcon(QIcon("icon.png"))
+        self.resize(1100, 600)
+        self.setup_ui()
+        self.load_changes()
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        range_layout = QHBoxLayout()
+        now = QDateTime.currentDateTime()
+        self.start_edit = QDateTimeEdit(now.addDays(-30), calendarPopup=True)
+        self.start_edit.setDisplayFormat("yyyy-MM-dd HH:mm")
+        self.end_edit = QDateTimeEdit(now.addDays(1), calendarPopup=True)
+        self.end_edit.setDisplayFormat("yyyy-MM-dd HH:mm")
+        self.query_btn = QPushButton("查询")
+        self.query_btn.clicked.connect(self.load_changes)
+        range_layout.addWidget(QLabel("从"))
+        range_layout.addWidget(self.start_edit)
+        range_layout.addWidget(QLabel("到"))
+        range_layout.addWidget(self.end_edit)
+        range_layout.addWidget(self.query_btn)
+        layout.addLayout(range_layout)
+
+        self.change_table = QTableWidget()
+        headers = ["变更时间", "记录ID", "操作"] + list(self.LABELS.values())
+        self.change_table.setColumnCount(len(headers))
+        self.change_table.setHorizontalHeaderLabels(headers)
+        self.change_table.verticalHeader().setVisible(False)
+        self.change_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.change_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.change_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.change_table)
+
+        if self.record_id is not None:
+            as_of_layout = QHBoxLayout()
+            self.as_of_edit = QDateTimeEdit(now, calendarPopup=True)
+            self.as_of_edit.setDisplayFormat("yyyy-MM-dd HH:mm:ss")
+            self.as_of_btn = QPushButton("查看该时刻状态")
+            self.as_of_btn.clicked.connect(self.show_as_of)
+            self.as_of_label = QLabel()
+            self.as_of_label.setWordWrap(True)
+            as_of_layout.addWidget(self.as_of_edit)
+            as_of_layout.addWidget(self.as_of_btn)
+            as_of_layout.addWidget(self.as_of_label, 1)
+            layout.addLayout(as_of_layout)
+
+        self.setLayout(layout)
+
+    def load_changes(self):
+        """查询时间段内的变更"""
+        changes = self.system.changes_in_range(
+            self.start_edit.dateTime().toString("yyyy-MM-dd HH:mm"),
+            self.end_edit.dateTime().toString("yyyy-MM-dd HH:mm"),
+            self.record_id
+        )
+        self.change_table.setRowCount(len(changes))
+        for row, (changed_at, record_id, op, values) in enumerate(changes):
+            cells = [changed_at[:19], str(record_id), HISTORY_OPS.get(op, op)]
+            cells += [str(values[name]) for name in self.LABELS]
+            for col, text in enumerate(cells):
+                item = QTableWidgetItem(text)
+                if op == "D":
+                    item.setForeground(QColor("#fa5252"))
+                self.change_table.setItem(row, col, item)
+
+    def show_as_of(self):
+        """显示记录在指定时刻的状态"""
+        timestamp = self.as_of_edit.dateTime().toString("yyyy-MM-dd HH:mm:ss")
+        state = self.system.record_as_of(self.record_id, timestamp)
+        if state is None:
+            self.as_of_label.setText("该时刻记录尚不存在（或历史已被压缩）")
+            return
+        op, values = state
+        if op == "D":
+            self.as_of_label.setText("该时刻记录已删除")
+            return
+        summary = "  ".join(f"{label}: {values[name]}" for name, label in self.LABELS.items())
+        self.as_of_label.setText(("（已归档）" if op == "A" else "") + summary)
+
+
+class DiagnosticsDialog(QDialog):
+    """诊断面板：显示计时、计数器和采集结果"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("诊断面板")
+        self.setWindowIcon(QIcon("icon.png"))
+        self.resize(900, 700)
+        self.setup_ui()
+        self.refresh()
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        self.span_table = QTableWidget()
+        self.span_table.setColumnCount(5)
+        self.span_table.setHorizontalHeaderLabels(["区间", "次数", "总耗时(ms)", "平均(ms)", "最大(ms)"])
+        self.span_table.verticalHeader().setVisible(False)
+        self.span_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.span_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+
+        self.counter_table = QTableWidget()
+        self.counter_table.setColumnCount(2)
+        self.counter_table.setHorizontalHeaderLabels(["计数器", "数值"])
+        self.counter_table.verticalHeader().setVisible(False)
+        self.counter_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.counter_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+
+        self.report_text = QTextEdit()
+        self.report_text.setReadOnly(True)
+        self.report_text.setFont(QFont("Consolas", 9))
+
+        btn_layout = QHBoxLayout()
+        self.refresh_btn = QPushButton("刷新")
+        self.refresh_btn.clicked.connect(self.refresh)
+        self.reset_btn = QPushButton("清零")
+        self.reset_btn.clicked.connect(self.on_reset)
+        self.export_json_btn = QPushButton("导出 JSON")
+        self.export_json_btn.clicked.connect(self.on_export_json)
+        self.export_trace_btn = QPushButton("导出 Chrome Trace")
+        self.export_trace_btn.clicked.connect(self.on_export_trace)
+        self.close_btn = QPushButton("关闭")
+        self.close_btn.clicked.connect(self.close)
+        for btn in (self.refresh_btn, self.reset_btn, self.export_json_btn, self.export_trace_btn, self.close_btn):
+            btn_layout.addWidget(btn)
+
+        layout.addWidget(QLabel("计时区间"))
+        layout.addWidget(self.span_table, 3)
+        layout.addWidget(QLabel("计数器"))
+        layout.addWidget(self.counter_table, 1)
+        layout.addWidget(QLabel("cProfile / tracemalloc 结果"))
+        layout.addWidget(self.report_text, 2)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+
+    def refresh(self):
+        """重新读取监测数据"""
+        data = instrumentation.snapshot()
+        spans = sorted(data["spans"].items(), key=lambda kv: kv[1]["total_ms"], reverse=True)
+        self.span_table.setRowCount(len(spans))
+        for row, (name, stat) in enumerate(spans):
+            values = [name, str(stat["count"]), f"{stat['total_ms']:.2f}", f"{stat['avg_ms']:.3f}", f"{stat['max_ms']:.2f}"]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col > 0:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.span_table.setItem(row, col, item)
+
+        counters = sorted(data["counters"].items())
+        self.counter_table.setRowCount(len(counters))
+        for row, (name, value) in enumerate(counters):
+            self.counter_table.setItem(row, 0, QTableWidgetItem(name))
+            item = QTableWidgetItem(str(value))
+            item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+            self.counter_table.setItem(row, 1, item)
+
+        reports = [text for text in (instrumentation.profile_report, instrumentation.memory_report) if text]
+        self.report_text.setPlainText("\n\n".join(reports) if reports else "暂无采集结果")
+
+    def on_reset(self):
+        instrumentation.reset()
+        self.refresh()
+
+    def on_export_json(self):
+        path, _ = QFileDialog.getSaveFileName(self, "导出 JSON", "qianmei-diagnostics.json", "JSON (*.json)")
+        if path:
+            instrumentation.export_json(path)
+
+    def on_export_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "导出 Chrome Trace", "qianmei-trace.json", "JSON (*.json)")
+        if path:
+            instrumentation.export_chrome_trace(path)
+
+
 class AppointmentSystem(QMainWindow):
+    reminder_requested = pyqtSignal(str, str, bool)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("仟美医疗项目登记系统")
         self.setGeometry(400, 50, 1280, 960)
         self.setWindowIcon(QIcon("icon.png"))
         self.showMaximized()
-        self.encryption_key = b'thisisasecretkey'  # 16字节密钥（示例，实际应安全存储）
+        self.encryption_key = ENCRYPTION_KEY
 
         # 初始化数据库
         self.init_db()
@@ -190,12 +1514,35 @@ class AppointmentSystem(QMainWindow):
         self.create_widgets()
         self.setup_layout()
         self.setup_connections()
+        self.setup_menu()
+
+        # 登记提交队列
+        self.pending_label = QLabel()
+        self.statusBar().addPermanentWidget(self.pending_label)
+        self.submission_queue = SubmissionQueue(PENDING_JOURNAL, DB_FILE, self)
+        self.submission_queue.pending_changed.connect(self.on_pending_changed)
+        self.submission_queue.flushed.connect(self.on_submissions_flushed)
+        self.submission_queue.flush_failed.connect(self.on_submissions_failed)
+
+        # 定时备份
+        self.backup_manager = BackupManager(DB_FILE, ARCHIVE_DB, BACKUP_DIR, self)
+        self.backup_manager.progress.connect(self.on_backup_progress)
+        self.backup_manager.finished.connect(self.on_backup_finished)
+        self.backup_manager.failed.connect(self.on_backup_failed)
+
+        # 预约提醒
+        self.setup_reminders()
 
         # 初始化数据
         self.refresh_table()
+        replayed = self.submission_queue.replay()
 
         # 初始化状态栏
         self.statusBar().showMessage("就绪 | 总预约数: 0")
+        if replayed:
+            self.show_status(f"发现 {replayed} 条上次未保存的登记，正在补写...", "warning")
+        elif self.undecryptable:
+            self.show_status(f"有 {self.undecryptable} 条记录无法解密，尾号未补写", "warning")
 
     def encrypt(self, plain_text):
         cipher = AES.new(self.encryption_key, AES.MODE_ECB)
@@ -204,10 +1551,11 @@ class AppointmentSystem(QMainWindow):
         return base64.b64encode(encrypted).decode('utf-8')
 
     def decrypt(self, cipher_text):
-        cipher = AES.new(self.encryption_key, AES.MODE_ECB)
-        encrypted_data = base64.b64decode(cipher_text)
-        decrypted = cipher.decrypt(encrypted_data)
-        return unpad(decrypted, AES.block_size).decode('utf-8')
+        with instrumentation.span("crypto.decrypt"):
+            cipher = AES.new(self.encryption_key, AES.MODE_ECB)
+            encrypted_data = base64.b64decode(cipher_text)
+            decrypted = cipher.decrypt(encrypted_data)
+            return unpad(decrypted, AES.block_size).decode('utf-8')
 
     def setup_style(self):
         """设置全局样式"""
@@ -243,7 +1591,7 @@ class AppointmentSystem(QMainWindow):
             QPushButton:pressed {
                 background-color: #228be6;
             }
-            QTableWidget {
+            QTableView {
                 background: white;
                 selection-color: black;  
                 alternate-background-color: #f8f9fa;
@@ -328,18 +1676,20 @@ class AppointmentSystem(QMainWindow):
         self.search_input.setPlaceholderText("输入姓名/电话搜索...")
         self.search_btn = QPushButton("🔍 搜索")
         self.reset_btn = QPushButton("🔄 重置")
+        self.history_check = QCheckBox("包含历史")
+        self.history_check.setToolTip("同时显示已归档的历史预约")
+        self.mask_check = QCheckBox("隐藏敏感信息")
+        self.mask_check.setChecked(True)
+        self.mask_check.setToolTip("身份证号和电话只显示后4位，右键“显示敏感信息”查看完整内容")
 
         # 表格区域
-        self.appointment_table = QTableWidget()
-        self.appointment_table.setColumnCount(13)
-        self.appointment_table.setHorizontalHeaderLabels(
-            ["ID", "客户姓名", "性别", "年龄", "身份证号",
-             "联系电话", "预约时间", "项目", "设计总监",
-             "所属部门", "首次登记", "金额", "备注"]
-        )
+        self.table_model = AppointmentTableModel(self.decrypt, self)
+        self.appointment_table = QTableView()
+        self.appointment_table.setModel(self.table_model)
         self.appointment_table.verticalHeader().setVisible(False)
-        self.appointment_table.setEditTriggers(QTableWidget.NoEditTriggers)
-        self.appointment_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.appointment_table.setEditTriggers(QTableView.NoEditTriggers)
+        self.appointment_table.setSelectionBehavior(QTableView.SelectRows)
+        self.appointment_table.setSelectionMode(QTableView.ExtendedSelection)  # 支持多选批量操作
         self.appointment_table.setAlternatingRowColors(True)
         self.appointment_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.appointment_table.setSortingEnabled(True)
@@ -358,26 +1708,125 @@ class AppointmentSystem(QMainWindow):
         print_action = menu.addAction("🖨️ 打印")
         print_action.triggered.connect(self.print_selected_row)
 
+        # 查看当前行的修改历史
+        history_action = menu.addAction("📜 修改历史")
+        history_action.triggered.connect(self.show_selected_history)
+
+        # 批量操作（对所有选中行生效）
+        menu.addSeparator()
+        assign_action = menu.addAction("👤 修改设计总监/部门...")
+        assign_action.triggered.connect(self.bulk_assign)
+        shift_action = menu.addAction("🕒 调整预约时间...")
+        shift_action.triggered.connect(self.bulk_shift_time)
+
+        # 脱敏模式下查看明文
+        if self.mask_check.isChecked():
+            reveal_action = menu.addAction("👁️ 显示敏感信息")
+            reveal_action.triggered.connect(self.reveal_selected_row)
+
         # 显示菜单
         menu.exec_(self.appointment_table.viewport().mapToGlobal(position))
 
     def print_selected_row(self):
         # 获取选中的行
-        selected_row = self.appointment_table.currentRow()
-        if selected_row == -1:  # 如果没有选中行
+        selected_rows = self.selected_rows()
+        if not selected_rows:  # 如果没有选中行
             QMessageBox.warning(self, "警告", "请先选择要打印的行！")
             return
 
-        # 获取选中行的数据
-        row_data = []
-        for col in range(self.appointment_table.columnCount()):
-            item = self.appointment_table.item(selected_row, col)
-            row_data.append(item.text() if item else "")
+        # 获取选中行的数据（脱敏单元格在此时才解密）
+        rows_data = [
+            [self.table_model.cell_text(row, col) for col in range(self.table_model.columnCount())]
+            for row in selected_rows
+        ]
+
+        # 生成打印内容，多条记录在同一次打印中分页
+        self.generate_print_content(rows_data)
+
+    def selected_rows(self):
+        """选中的行号（升序）"""
+        rows = sorted(index.row() for index in self.appointment_table.selectionModel().selectedRows())
+        if not rows and self.current_row() != -1:
+            rows = [self.current_row()]
+        return rows
+
+    def current_row(self):
+        """当前行号，未选中时为 -1"""
+        return self.appointment_table.currentIndex().row()
+
+    def selected_record_ids(self, action):
+        """选中行中可修改的记录ID，归档记录会被跳过并提示"""
+        rows = self.selected_rows()
+        if not rows:
+            QMessageBox.warning(self, "警告", f"请先选择要{action}的行！")
+            return []
+        record_ids = [self.table_model.record_id(row) for row in rows if not self.table_model.is_archived(row)]
+        if len(record_ids) < len(rows):
+            if not record_ids:
+                QMessageBox.warning(self, "警告", f"历史归档记录为只读，不能{action}！")
+                return []
+            self.show_status(f"已跳过 {len(rows) - len(record_ids)} 条历史归档记录", "warning")
+        return record_ids
+
+    def exec_batch(self, sql, columns):
+        """在单个事务中以 execBatch 执行批量语句，columns 为每个占位符对应的值列表"""
+        self.db.transaction()
+        query = QSqlQuery()
+        query.prepare(sql)
+        for values in columns:
+            query.addBindValue(values)
+        with instrumentation.span("db.batch"):
+            ok = query.execBatch()
+        if ok and self.db.commit():
+            return None
+        error = query.lastError().text() or self.db.lastError().text()
+        self.db.rollback()
+        return error
+
+    def bulk_assign(self):
+        """批量修改设计总监 / 所属部门"""
+        record_ids = self.selected_record_ids("修改")
+        if not record_ids:
+            return
+        dialog = BulkAssignDialog(len(record_ids), self)
+        if dialog.exec() != QDialog.Accepted:
+            return
+        changes = dialog.changes()
+        if not changes:
+            return
+
+        assignments = ", ".join(f"{column} = ?" for column in changes)
+        columns = [[value] * len(record_ids) for value in changes.values()] + [record_ids]
+        error = self.exec_batch(f"UPDATE appointments SET {assignments} WHERE id = ?", columns)
+        if error is not None:
+            QMessageBox.critical(self, "错误", f"批量修改失败: {error}")
+            return
+        self.reload_table()
+        self.show_status(f"已修改 {len(record_ids)} 条记录", "success")
+
+    def bulk_shift_time(self):
+        """批量平移预约时间"""
+        record_ids = self.selected_record_ids("调整")
+        if not record_ids:
+            return
+        minutes, ok = QInputDialog.getInt(
+            self, "批量调整时间", f"将选中的 {len(record_ids)} 条预约平移（分钟，负数为提前）：",
+            60, -7 * 24 * 60, 7 * 24 * 60, 15
+        )
+        if not ok or minutes == 0:
+            return
 
-        # 生成打印内容
-        self.generate_print_content(row_data)
+        error = self.exec_batch(
+            "UPDATE appointments SET appointment_time = strftime('%Y-%m-%d %H:%M', appointment_time, ?) WHERE id = ?",
+            [[f"{minutes:+d} minutes"] * len(record_ids), record_ids]
+        )
+        if error is not None:
+            QMessageBox.critical(self, "错误", f"批量调整失败: {error}")
+            return
+        self.reload_table()
+        self.show_status(f"已调整 {len(record_ids)} 条预约时间", "success")
 
-    def generate_print_content(self, row_data):
+    def generate_print_content(self, rows_data):
         # 创建打印预览对话框
         try:
             printer = QPrinter(QPrinter.HighResolution)
@@ -388,16 +1837,29 @@ class AppointmentSystem(QMainWindow):
             if preview_widget:
                 # 设置缩放比例为50%
                 preview_widget.setZoomFactor(0.8)
-            preview_dialog.paintRequested.connect(lambda: self.render_print_content(printer, row_data))
+            preview_dialog.paintRequested.connect(lambda: self.render_print_pages(printer, rows_data))
             preview_dialog.exec_()
         except Exception as e:
             print(e)
 
     def render_print_content(self, printer, row_data):
-        # 创建 QPainter 对象
-        painter = QPainter()
-        painter.begin(printer)
-
+        self.render_print_pages(printer, [row_data])
+
+    def render_print_pages(self, printer, rows_data):
+        """每条记录打印一页"""
+        with instrumentation.span("print.render"):
+            # 创建 QPainter 对象
+            painter = QPainter()
+            painter.begin(printer)
+            for index, row_data in enumerate(rows_data):
+                if index:
+                    printer.newPage()
+                self.draw_print_page(painter, printer, row_data)
+
+            # 结束绘制
+            painter.end()
+
+    def draw_print_page(self, painter, printer, row_data):
         # 设置字体
         font = QFont("Microsoft YaHei", 10)  # 使用更清晰的字体
         painter.setFont(font)
@@ -459,40 +1921,29 @@ class AppointmentSystem(QMainWindow):
         # 绘制表格边框
         painter.drawRect(margin, y_offset, page_width, len(labels) * row_height)
 
-        # 结束绘制
-        painter.end()
-
     def delete_selected_row(self):
-        # 获取选中的行
-        selected_row = self.appointment_table.currentRow()
-        if selected_row == -1:  # 如果没有选中行
-            QMessageBox.warning(self, "警告", "请先选择要删除的行！")
-            return
-
         # 获取选中行的ID
-        record_id = int(self.appointment_table.item(selected_row, 0).text())
+        record_ids = self.selected_record_ids("删除")
+        if not record_ids:
+            return
 
         # 弹出确认对话框
         reply = QMessageBox.question(
             self, "确认删除",
-            "确定要删除这条记录吗？",
+            "确定要删除这条记录吗？" if len(record_ids) == 1 else f"确定要删除选中的 {len(record_ids)} 条记录吗？",
             QMessageBox.Yes | QMessageBox.No
         )
         if reply == QMessageBox.No:
             return
 
-        # 从数据库中删除记录
-        query = QSqlQuery()
-        query.prepare("DELETE FROM appointments WHERE id = ?")
-        query.addBindValue(record_id)
-
-        if query.exec():
-            # 从表格中移除行
-            self.appointment_table.removeRow(selected_row)
+        # 从数据库中删除记录（单个事务）
+        with instrumentation.span("db.delete"):
+            error = self.exec_batch("DELETE FROM appointments WHERE id = ?", [record_ids])
+        if error is None:
             self.show_status("删除成功！", "success")
-            self.refresh_table()  # 刷新表格数据
+            self.reload_table()  # 刷新表格数据
         else:
-            QMessageBox.critical(self, "错误", f"删除失败: {query.lastError().text()}")
+            QMessageBox.critical(self, "错误", f"删除失败: {error}")
 
     def setup_layout(self):
         """设置界面布局"""
@@ -526,6 +1977,8 @@ class AppointmentSystem(QMainWindow):
         search_layout.addWidget(self.search_input)
         search_layout.addWidget(self.search_btn)
         search_layout.addWidget(self.reset_btn)
+        search_layout.addWidget(self.history_check)
+        search_layout.addWidget(self.mask_check)
 
         # 表格区域
         table_group = QGroupBox("预约记录")
@@ -537,22 +1990,93 @@ class AppointmentSystem(QMainWindow):
         main_layout.addWidget(input_group, 1)
         main_layout.addWidget(table_group, 3)
 
+    def setup_menu(self):
+        """创建菜单栏"""
+        data_menu = self.menuBar().addMenu("数据")
+        archive_action = data_menu.addAction("归档历史预约...")
+        archive_action.triggered.connect(self.run_archive)
+        data_menu.addSeparator()
+        backup_action = data_menu.addAction("立即备份")
+        backup_action.triggered.connect(self.run_backup)
+        restore_action = data_menu.addAction("校验并恢复备份...")
+        restore_action.triggered.connect(self.restore_backup)
+        data_menu.addSeparator()
+        reminder_action = data_menu.addAction("发送明日提醒")
+        reminder_action.triggered.connect(lambda: self.send_reminders())
+        data_menu.addSeparator()
+        history_action = data_menu.addAction("变更记录...")
+        history_action.triggered.connect(lambda: self.show_history())
+        compact_action = data_menu.addAction("压缩变更历史...")
+        compact_action.triggered.connect(self.run_compact_history)
+
+        debug_menu = self.menuBar().addMenu("调试")
+
+        self.profile_action = QAction("启用性能监测", self, checkable=True)
+        self.profile_action.setChecked(instrumentation.enabled)
+        self.profile_action.toggled.connect(self.toggle_instrumentation)
+        debug_menu.addAction(self.profile_action)
+
+        self.cprofile_action = QAction("cProfile 采集", self, checkable=True)
+        self.cprofile_action.toggled.connect(self.toggle_cprofile)
+        debug_menu.addAction(self.cprofile_action)
+
+        self.tracemalloc_action = QAction("内存分配跟踪 (tracemalloc)", self, checkable=True)
+        self.tracemalloc_action.toggled.connect(self.toggle_tracemalloc)
+        debug_menu.addAction(self.tracemalloc_action)
+
+        debug_menu.addSeparator()
+        reminder_preview_action = debug_menu.addAction("提醒预览（写入本地文件）")
+        reminder_preview_action.triggered.connect(lambda: self.send_reminders(preview=True))
+        diagnostics_action = debug_menu.addAction("诊断面板...")
+        diagnostics_action.triggered.connect(self.show_diagnostics)
+
+    def toggle_instrumentation(self, checked):
+        instrumentation.enabled = checked
+        self.show_status("性能监测已开启" if checked else "性能监测已关闭", "info")
+
+    def toggle_cprofile(self, checked):
+        if checked:
+            instrumentation.start_profile()
+            self.show_status("cProfile 采集中...", "warning")
+        else:
+            instrumentation.stop_profile()
+            self.show_status("cProfile 采集结束，结果见诊断面板", "info")
+
+    def toggle_tracemalloc(self, checked):
+        if checked:
+            instrumentation.start_tracemalloc()
+            self.show_status("内存分配跟踪中...", "warning")
+        else:
+            instrumentation.stop_tracemalloc()
+            self.show_status("内存分配跟踪结束，结果见诊断面板", "info")
+
+    def show_diagnostics(self):
+        """打开诊断面板（非模态）"""
+        if getattr(self, "diagnostics_dialog", None) is None:
+            self.diagnostics_dialog = DiagnosticsDialog(self)
+        self.diagnostics_dialog.refresh()
+        self.diagnostics_dialog.show()
+        self.diagnostics_dialog.raise_()
+
     def setup_connections(self):
         """连接信号槽"""
         self.submit_btn.clicked.connect(self.add_appointment)
         self.search_btn.clicked.connect(self.search_appointments)
         self.reset_btn.clicked.connect(self.clear_search)
         self.search_input.textChanged.connect(self.delayed_search)
-        self.appointment_table.cellDoubleClicked.connect(self.show_edit_dialog)
+        self.history_check.toggled.connect(self.reload_table)
+        self.mask_check.toggled.connect(self.reload_table)
+        self.appointment_table.doubleClicked.connect(lambda index: self.show_edit_dialog(index.row()))
         # 在create_widgets方法中修改表格属性
-        self.appointment_table.setEditTriggers(QTableWidget.NoEditTriggers)  # 保持不可直接编辑
-        self.appointment_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.appointment_table.setEditTriggers(QTableView.NoEditTriggers)  # 保持不可直接编辑
+        self.appointment_table.setSelectionBehavior(QTableView.SelectRows)
         self.appointment_table.setToolTip("双击行进行编辑")  # 添加提示
 
     def init_db(self):
         """初始化数据库"""
+        self.undecryptable = 0
         self.db = QSqlDatabase.addDatabase("QSQLITE")
-        self.db.setDatabaseName("qianmei.db")
+        self.db.setDatabaseName(DB_FILE)
 
         if not self.db.open():
             QMessageBox.critical(
@@ -561,9 +2085,19 @@ class AppointmentSystem(QMainWindow):
             )
             return False
 
+        self.setup_schema()
+        self.attach_archive()
+        self.undecryptable = self.backfill_suffixes("main")
+        if self.archive_attached:
+            self.undecryptable += self.backfill_suffixes("archive")
+        self.compact_history(HISTORY_RETENTION_DAYS)
+        return True
+
+    def setup_schema(self):
+        """创建当前表、补齐新增字段并建立索引"""
         query = QSqlQuery()
         query.exec("""
-            CREATE TABLE IF NOT EXISTS qianmei (
+            CREATE TABLE IF NOT EXISTS appointments (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 customer_name TEXT NOT NULL,
                 gender TEXT NOT NULL,
@@ -580,8 +2114,481 @@ class AppointmentSystem(QMainWindow):
                 submit_time DATETIME NOT NULL
             )
         """)
+        self.ensure_columns("main")
+        query.exec("CREATE INDEX IF NOT EXISTS main.idx_appointments_time ON appointments (appointment_time)")
+        query.exec("""
+            CREATE UNIQUE INDEX IF NOT EXISTS main.idx_appointments_submission
+            ON appointments (submission_key) WHERE submission_key IS NOT NULL
+        """)
+        query.exec("""
+            CREATE INDEX IF NOT EXISTS main.idx_appointments_reminder
+            ON appointments (appointment_time) WHERE reminder_sent_at IS NULL
+        """)
+        query.exec("DROP TRIGGER IF EXISTS main.appointments_reminder_reset")
+        query.exec(REMINDER_RESET_TRIGGER)
+        self.setup_history()
+
+    def setup_history(self):
+        """变更历史表及维护它的触发器
+
+        历史表只追加不修改；删除在历史中记为软删除（is_deleted = 1），
+        归档迁移记为 A。列表查询始终只读当前表，不受历史表影响。
+        """
+        query = QSqlQuery("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'appointments_history'")
+        seed = not query.next()
+        query.exec("""
+            CREATE TABLE IF NOT EXISTS main.appointments_history (
+                history_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                record_id INTEGER NOT NULL,
+                op TEXT NOT NULL,
+                is_deleted INTEGER NOT NULL DEFAULT 0,
+                changed_at TEXT NOT NULL
+            )
+        """)
+        query.exec("PRAGMA main.table_info(appointments_history)")
+        existing = set()
+        while query.next():
+            existing.add(query.value(1))
+        for name in HISTORY_COLUMNS:
+            if name not in existing:
+                query.exec(f"ALTER TABLE main.appointments_history ADD COLUMN {name}")
+        if seed:
+            # 首次启用时为已有记录写入初始版本，时间取登记提交时间
+            query.exec(f"""
+                INSERT INTO main.appointments_history (record_id, op, is_deleted, changed_at, {", ".join(HISTORY_COLUMNS)})
+                SELECT id, 'I', 0, submit_time, {", ".join(HISTORY_COLUMNS)} FROM main.appointments
+            """)
+        query.exec("CREATE INDEX IF NOT EXISTS main.idx_history_record ON appointments_history (record_id, changed_at)")
+        query.exec("CREATE INDEX IF NOT EXISTS main.idx_history_changed ON appointments_history (changed_at)")
+        # 归档迁移期间写入一行，删除触发器据此区分归档与删除
+        query.exec("CREATE TABLE IF NOT EXISTS main.audit_archiving (flag INTEGER)")
+
+        # 字段可能随版本增加，触发器每次启动重建
+        columns = ", ".join(HISTORY_COLUMNS)
+        now = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+        new_values = ", ".join(f"NEW.{name}" for name in HISTORY_COLUMNS)
+        old_values = ", ".join(f"OLD.{name}" for name in HISTORY_COLUMNS)
+        changed = " OR ".join(f"OLD.{name} IS NOT NEW.{name}" for name in AUDITED_COLUMNS)
+        archiving = "EXISTS (SELECT 1 FROM audit_archiving)"
+        for name in ("insert", "update", "delete", "immutable"):
+            query.exec(f"DROP TRIGGER IF EXISTS main.appointments_history_{name}")
+        query.exec(f"""
+            CREATE TRIGGER main.appointments_history_insert AFTER INSERT ON appointments
+            BEGIN
+                INSERT INTO appointments_history (record_id, op, is_deleted, changed_at, {columns})
+                VALUES (NEW.id, 'I', 0, {now}, {new_values});
+            END
+        """)
+        query.exec(f"""
+            CREATE TRIGGER main.appointments_history_update AFTER UPDATE ON appointments
+            WHEN {changed}
+            BEGIN
+                INSERT INTO appointments_history (record_id, op, is_deleted, changed_at, {columns})
+                VALUES (NEW.id, 'U', 0, {now}, {new_values});
+            END
+        """)
+        query.exec(f"""
+            CREATE TRIGGER main.appointments_history_delete AFTER DELETE ON appointments
+            BEGIN
+                INSERT INTO appointments_history (record_id, op, is_deleted, changed_at, {columns})
+                VALUES (OLD.id, CASE WHEN {archiving} THEN 'A' ELSE 'D' END,
+                        CASE WHEN {archiving} THEN 0 ELSE 1 END, {now}, {old_values});
+            END
+        """)
+        query.exec("""
+            CREATE TRIGGER main.appointments_history_immutable BEFORE UPDATE ON appointments_history
+            BEGIN
+                SELECT RAISE(ABORT, 'appointments_history is append-only');
+            END
+        """)
+
+    def record_as_of(self, record_id, timestamp):
+        """某条记录在指定时刻的状态，返回 (操作, 字段字典)；当时尚不存在返回 None"""
+        query = QSqlQuery()
+        query.prepare(f"""
+            SELECT op, {", ".join(HISTORY_COLUMNS)} FROM appointments_history
+            WHERE record_id = ? AND changed_at <= ?
+            ORDER BY changed_at DESC, history_id DESC LIMIT 1
+        """)
+        query.addBindValue(record_id)
+        query.addBindValue(timestamp)
+        if not query.exec() or not query.next():
+            return None
+        return query.value(0), {name: query.value(i + 1) for i, name in enumerate(HISTORY_COLUMNS)}
+
+    def changes_in_range(self, start, end, record_id=None):
+        """时间段内的变更，按时间先后返回 [(变更时间, 记录ID, 操作, 字段字典), ...]"""
+        query = QSqlQuery()
+        condition = "changed_at >= ? AND changed_at < ?"
+        if record_id is not None:
+            condition += " AND record_id = ?"
+        query.prepare(f"""
+            SELECT changed_at, record_id, op, {", ".join(HISTORY_COLUMNS)} FROM appointments_history
+            WHERE {condition}
+            ORDER BY changed_at, history_id
+        """)
+        query.addBindValue(start)
+        query.addBindValue(end)
+        if record_id is not None:
+            query.addBindValue(record_id)
+        changes = []
+        with instrumentation.span("db.history"):
+            if query.exec():
+                while query.next():
+                    values = {name: query.value(i + 3) for i, name in enumerate(HISTORY_COLUMNS)}
+                    changes.append((query.value(0), query.value(1), query.value(2), values))
+        return changes
+
+    def compact_history(self, days):
+        """压缩早于 days 天前的历史：每条记录只保留最后一个版本，已删除的记录整体清除"""
+        cutoff = QDateTime.currentDateTime().addDays(-days).toString("yyyy-MM-dd HH:mm:ss")
+        self.db.transaction()
+        query = QSqlQuery()
+        query.prepare("""
+            DELETE FROM appointments_history
+            WHERE changed_at < ? AND history_id NOT IN (
+                SELECT MAX(history_id) FROM appointments_history
+                WHERE changed_at < ? GROUP BY record_id
+            )
+        """)
+        query.addBindValue(cutoff)
+        query.addBindValue(cutoff)
+        with instrumentation.span("db.history"):
+            ok = query.exec()
+            removed = query.numRowsAffected()
+            if ok:
+                query.prepare("DELETE FROM appointments_history WHERE changed_at < ? AND op = 'D'")
+                query.addBindValue(cutoff)
+                ok = query.exec()
+                removed += query.numRowsAffected()
+        if not ok:
+            self.db.rollback()
+            return -1
+        self.db.commit()
+        return removed
+
+    def run_compact_history(self):
+        days, ok = QInputDialog.getInt(
+            self, "压缩变更历史", "压缩多少天以前的变更历史：",
+            HISTORY_RETENTION_DAYS, 1, 36500
+        )
+        if not ok:
+            return
+        removed = self.compact_history(days)
+        if removed < 0:
+            self.show_status("压缩变更历史失败", "error")
+        else:
+            self.show_status(f"已压缩 {removed} 条历史版本", "success")
+
+    def show_history(self, record_id=None):
+        """打开变更历史窗口（非模态）"""
+        dialog = HistoryDialog(self, record_id)
+        dialog.setAttribute(Qt.WA_DeleteOnClose)
+        dialog.show()
+
+    def show_selected_history(self):
+        row = self.current_row()
+        if row == -1:
+            QMessageBox.warning(self, "警告", "请先选择要查看的行！")
+            return
+        self.show_history(self.table_model.record_id(row))
+
+    def backfill_suffixes(self, schema, batch_size=1000):
+        """为旧记录补写脱敏尾号（一次性迁移，每批一个事务）
+
+        无法解密的记录保持尾号为空，返回这类记录的条数。
+        """
+        select = QSqlQuery()
+        update = QSqlQuery()
+        last_id = 0
+        failed = 0
+        while True:
+            select.exec(f"""
+                SELECT id, id_number, phone FROM {schema}.appointments
+                WHERE (id_suffix IS NULL OR phone_suffix IS NULL) AND id > {last_id}
+                ORDER BY id LIMIT {batch_size}
+            """)
+            rows = []
+            while select.next():
+                rows.append((select.value(0), select.value(1), select.value(2)))
+            select.finish()
+            if not rows:
+                return failed
+            last_id = rows[-1][0]
+            ids, id_suffixes, phone_suffixes = [], [], []
+            for record_id, id_number, phone in rows:
+                try:
+                    id_suffix = self.decrypt(id_number)[-SUFFIX_LENGTH:]
+                    phone_suffix = self.decrypt(phone)[-SUFFIX_LENGTH:]
+                except (ValueError, TypeError):
+                    failed += 1
+                    continue
+                ids.append(record_id)
+                id_suffixes.append(id_suffix)
+                phone_suffixes.append(phone_suffix)
+            if not ids:
+                continue
+            self.db.transaction()
+            update.prepare(f"UPDATE {schema}.appointments SET id_suffix = ?, phone_suffix = ? WHERE id = ?")
+            update.addBindValue(id_suffixes)
+            update.addBindValue(phone_suffixes)
+            update.addBindValue(ids)
+            if not update.execBatch():
+                self.db.rollback()
+                return failed
+            self.db.commit()
+
+    def ensure_columns(self, schema):
+        """为旧库补齐 EXTRA_COLUMNS 中的新增字段"""
+        query = QSqlQuery(f"PRAGMA {schema}.table_info(appointments)")
+        existing = set()
+        while query.next():
+            existing.add(query.value(1))
+        for name, definition in EXTRA_COLUMNS:
+            if name not in existing:
+                query.exec(f"ALTER TABLE {schema}.appointments ADD COLUMN {name} {definition}")
+
+    def attach_archive(self):
+        """挂载归档库，并建立当前表与归档表合并的临时视图"""
+        query = QSqlQuery()
+        query.prepare("ATTACH DATABASE ? AS archive")
+        query.addBindValue(ARCHIVE_DB)
+        if not query.exec():
+            self.archive_attached = False
+            self.show_status(f"归档库挂载失败: {query.lastError().text()}", "error")
+            return False
+
+        query.exec("""
+            CREATE TABLE IF NOT EXISTS archive.appointments (
+                id INTEGER PRIMARY KEY,
+                customer_name TEXT NOT NULL,
+                gender TEXT NOT NULL,
+                age INTEGER NOT NULL,
+                id_number TEXT NOT NULL,
+                phone TEXT NOT NULL,
+                appointment_time DATETIME NOT NULL,
+                service_type TEXT NOT NULL,
+                design_director TEXT NOT NULL,
+                department TEXT NOT NULL,
+                is_first_time INTEGER NOT NULL,
+                amount TEXT NOT NULL,
+                notes TEXT,
+                submit_time DATETIME NOT NULL
+            )
+        """)
+        self.ensure_columns("archive")
+        query.exec("CREATE INDEX IF NOT EXISTS archive.idx_appointments_time ON appointments (appointment_time)")
+
+        columns = ", ".join(APPOINTMENT_COLUMNS)
+        query.exec("DROP VIEW IF EXISTS temp.all_appointments")
+        query.exec(f"""
+            CREATE TEMP VIEW all_appointments AS
+            SELECT {columns}, 0 AS archived FROM main.appointments
+            UNION ALL
+            SELECT {columns}, 1 AS archived FROM archive.appointments
+        """)
+        self.archive_attached = True
         return True
 
+    def listing_source(self):
+        """列表查询的数据源：默认只查当前表，勾选“包含历史”时并入归档库"""
+        if self.archive_attached and self.history_check.isChecked():
+            return "all_appointments"
+        return "(SELECT *, 0 AS archived FROM main.appointments)"
+
+    def archive_appointments(self, days):
+        """将预约时间早于 days 天前的记录分批迁入归档库，返回迁移条数"""
+        cutoff = QDateTime.currentDateTime().addDays(-days).toString("yyyy-MM-dd HH:mm")
+        columns = ", ".join(APPOINTMENT_COLUMNS)
+        batch = f"SELECT id FROM main.appointments WHERE appointment_time < ? ORDER BY id LIMIT {ARCHIVE_BATCH_SIZE}"
+        moved = 0
+        while True:
+            self.db.transaction()
+            query = QSqlQuery()
+            query.prepare(f"""
+                INSERT INTO archive.appointments ({columns})
+                SELECT {columns} FROM main.appointments WHERE id IN ({batch})
+            """)
+            query.addBindValue(cutoff)
+            with instrumentation.span("db.archive"):
+                ok = query.exec()
+                count = query.numRowsAffected()
+                if ok and count > 0:
+                    ok = query.exec("INSERT INTO main.audit_archiving VALUES (1)")
+                    query.prepare(f"DELETE FROM main.appointments WHERE id IN ({batch})")
+                    query.addBindValue(cutoff)
+                    ok = ok and query.exec() and query.exec("DELETE FROM main.audit_archiving")
+            if not ok:
+                self.db.rollback()
+                raise RuntimeError(query.lastError().text())
+            self.db.commit()
+            if count <= 0:
+                return moved
+            moved += count
+            self.show_status(f"正在归档... 已迁移 {moved} 条", "info")
+            QApplication.processEvents()  # 批次之间让出界面
+
+    def reconcile_archive(self):
+        """去掉主库中已迁入归档库的重复记录，并让自增序号越过归档库的最大 ID
+
+        只恢复了主库的旧快照会把之后归档过的记录带回主库，返回移除的条数。
+        """
+        if not self.archive_attached:
+            return 0
+        top = "(SELECT MAX(id) FROM archive.appointments)"
+        self.db.transaction()
+        query = QSqlQuery()
+        ok = query.exec("INSERT INTO main.audit_archiving VALUES (1)")
+        ok = ok and query.exec("DELETE FROM main.appointments WHERE id IN (SELECT id FROM archive.appointments)")
+        removed = query.numRowsAffected() if ok else 0
+        ok = ok and query.exec("DELETE FROM main.audit_archiving")
+        ok = ok and query.exec(f"UPDATE main.sqlite_sequence SET seq = {top} WHERE name = 'appointments' AND seq < {top}")
+        ok = ok and query.exec(f"""
+            INSERT INTO main.sqlite_sequence (name, seq)
+            SELECT 'appointments', {top}
+            WHERE {top} IS NOT NULL AND NOT EXISTS (SELECT 1 FROM main.sqlite_sequence WHERE name = 'appointments')
+        """)
+        if not ok:
+            self.db.rollback()
+            raise RuntimeError(query.lastError().text())
+        self.db.commit()
+        return removed
+
+    def run_archive(self):
+        """归档菜单项：选择归档范围并执行"""
+        if not self.archive_attached:
+            QMessageBox.warning(self, "警告", "归档库不可用")
+            return
+        days, ok = QInputDialog.getInt(
+            self, "归档历史预约", "归档多少天以前的预约：",
+            ARCHIVE_HORIZON_DAYS, 1, 36500
+        )
+        if not ok:
+            return
+        try:
+            moved = self.archive_appointments(days)
+        except RuntimeError as e:
+            QMessageBox.critical(self, "错误", f"归档失败: {e}")
+            return
+        self.refresh_table()
+        self.show_status(f"归档完成，共迁移 {moved} 条记录", "success")
+
+    def setup_reminders(self, sender=None):
+        """提醒批处理在后台线程运行；未配置正式发送器时只能在调试菜单中预览"""
+        self.reminder_running = False
+        self.reminder_preview = False
+        self.reminder_sender = sender or REMINDER_SENDER
+        self.reminder_thread = QThread(self)
+        self.reminder_worker = ReminderWorker(DB_FILE, self.decrypt, self.reminder_sender,
+                                              FileReminderSender(REMINDER_OUTBOX))
+        self.reminder_worker.moveToThread(self.reminder_thread)
+        self.reminder_requested.connect(self.reminder_worker.run)
+        self.reminder_worker.progress.connect(self.on_reminder_progress)
+        self.reminder_worker.finished.connect(self.on_reminders_finished)
+        self.reminder_worker.failed.connect(self.on_reminders_failed)
+        self.reminder_thread.finished.connect(self.reminder_worker.close, Qt.DirectConnection)
+        self.reminder_thread.start()
+
+        # 定时检查明日预约，已发送的不会重复发送
+        self.reminder_timer = QTimer(self)
+        self.reminder_timer.timeout.connect(lambda: self.send_reminders(quiet=True))
+        if self.reminder_sender is not None:
+            self.reminder_timer.start(REMINDER_CHECK_INTERVAL_MS)
+
+    def send_reminders(self, quiet=False, preview=False):
+        """发送明日预约提醒，preview 为真时只写入本地文件、不标记已提醒"""
+        if self.reminder_running:
+            if not quiet:
+                self.show_status("提醒正在发送中", "warning")
+            return
+        if not preview and self.reminder_sender is None:
+            if not quiet:
+                self.show_status("未配置短信发送器，可在调试菜单中预览提醒", "warning")
+            return
+        tomorrow = QDateTime(QDate.currentDate().addDays(1), QTime(0, 0))
+        self.reminder_running = True
+        self.reminder_preview = preview
+        self.reminder_requested.emit(
+            tomorrow.toString("yyyy-MM-dd HH:mm"),
+            tomorrow.addDays(1).toString("yyyy-MM-dd HH:mm"),
+            preview
+        )
+
+    def on_reminder_progress(self, done, total):
+        self.show_status(f"正在发送明日提醒... {done}/{total}", "info")
+
+    def on_reminders_finished(self, sent, failed):
+        self.reminder_running = False
+        if self.reminder_preview:
+            self.show_status(f"明日提醒预览已写入 {REMINDER_OUTBOX}：成功 {sent} 条，失败 {failed} 条",
+                             "warning" if failed else "success")
+        elif sent or failed:
+            self.show_status(f"明日提醒发送完成：成功 {sent} 条，失败 {failed} 条",
+                             "warning" if failed else "success")
+
+    def on_reminders_failed(self, message):
+        self.reminder_running = False
+        self.show_status(f"提醒发送失败: {message}", "error")
+
+    def run_backup(self):
+        if not self.backup_manager.start_backup():
+            self.show_status("备份正在进行中", "warning")
+
+    def on_backup_progress(self, percent):
+        self.show_status(f"正在备份... {percent}%", "info")
+
+    def on_backup_finished(self, path):
+        self.show_status(f"备份完成: {os.path.basename(path)}", "success")
+
+    def on_backup_failed(self, message):
+        self.show_status(f"备份失败: {message}", "error")
+
+    def restore_backup(self):
+        """选择快照，校验通过并确认后恢复"""
+        snapshots = self.backup_manager.snapshots()
+        if not snapshots:
+            QMessageBox.warning(self, "警告", "没有可用的备份")
+            return
+        names = [os.path.basename(path) for path in snapshots]
+        name, ok = QInputDialog.getItem(self, "恢复备份", "选择要恢复的备份：", names, 0, False)
+        if not ok:
+            return
+        snapshot = snapshots[names.index(name)]
+
+        valid, detail = self.backup_manager.verify(snapshot)
+        if not valid:
+            QMessageBox.critical(self, "错误", f"备份校验失败: {detail}")
+            return
+        reply = QMessageBox.question(
+            self, "确认恢复",
+            f"备份 {name} 校验通过，共 {detail} 条预约。\n恢复后当前数据将被替换（恢复前会自动另存一份），确定恢复吗？",
+            QMessageBox.Yes | QMessageBox.No
+        )
+        if reply == QMessageBox.No:
+            return
+
+        try:
+            safety = self.backup_manager.restore(snapshot)
+        except (sqlite3.Error, OSError) as e:
+            QMessageBox.critical(self, "错误", f"恢复失败: {e}")
+            return
+        self.setup_schema()
+        undecryptable = self.backfill_suffixes("main")
+        try:
+            removed = self.reconcile_archive()
+        except RuntimeError as e:
+            QMessageBox.critical(self, "错误", f"主库与归档库去重失败: {e}")
+            removed = 0
+        self.refresh_table()
+        message = f"已恢复备份 {name}，原数据另存为 {os.path.basename(safety)}"
+        if removed:
+            message += f"，移除已归档的重复记录 {removed} 条"
+        if undecryptable:
+            self.show_status(f"{message}；有 {undecryptable} 条记录无法解密，尾号未补写", "warning")
+            return
+        self.show_status(message, "success")
+
+
     def add_appointment(self):
         """添加新预约"""
         # 获取字段值
@@ -616,36 +2623,39 @@ class AppointmentSystem(QMainWindow):
             self.amount_input.setFocus()
             return
 
+        id_suffix = id_number[-SUFFIX_LENGTH:]
+        phone_suffix = phone[-SUFFIX_LENGTH:]
         id_number = self.encrypt(id_number)
         phone = self.encrypt(phone)
 
-        # 插入数据库
-        query = QSqlQuery()
-        query.prepare("""
-            INSERT INTO appointments 
-            (customer_name, gender, age, id_number, phone,
-             appointment_time, service_type, design_director, department,
-             is_first_time, amount, notes, submit_time)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """)
-        params = [
-            name, gender, age, id_number, phone,
-            time, service, designer, dept, is_first, amount, notes,QDateTime.currentDateTime().toString("yyyy-MM-dd HH:mm")
-        ]
-        for value in params:
-            query.addBindValue(value)
-
-        if not query.exec():
-            QMessageBox.critical(
-                self, "数据库错误",
-                f"保存失败: {query.lastError().text()}"
-            )
+        # 写入提交队列，由后台线程合并写库
+        record = {
+            "customer_name": name, "gender": gender, "age": age,
+            "id_number": id_number, "phone": phone, "appointment_time": time,
+            "service_type": service, "design_director": designer, "department": dept,
+            "is_first_time": is_first, "amount": amount, "notes": notes,
+            "submit_time": QDateTime.currentDateTime().toString("yyyy-MM-dd HH:mm"),
+            "id_suffix": id_suffix, "phone_suffix": phone_suffix,
+        }
+        try:
+            self.submission_queue.submit(record)
+        except OSError as e:
+            QMessageBox.critical(self, "错误", f"登记受理失败: {e}")
             return
 
         self.clear_form()
-        self.refresh_table()
-        QMessageBox.information(self, "提示", "登记信息提交成功")
-        self.show_status("登记信息提交成功！", "success")
+        self.show_status("登记信息已受理，正在保存...", "info")
+
+    def on_pending_changed(self, count):
+        """更新状态栏中的待保存数量"""
+        self.pending_label.setText(f"待保存: {count}" if count else "")
+
+    def on_submissions_flushed(self, count):
+        self.reload_table()
+        self.show_status(f"已保存 {count} 条登记信息", "success")
+
+    def on_submissions_failed(self, message):
+        self.show_status(f"登记保存失败，稍后自动重试: {message}", "error")
 
     def search_appointments(self):
         """搜索预约"""
@@ -653,36 +2663,31 @@ class AppointmentSystem(QMainWindow):
         if keyword.strip() == "":
             return
         query = QSqlQuery()
-        query.prepare("""
-            SELECT id, customer_name, gender, age, id_number,
-                   phone, strftime('%Y-%m-%d %H:%M', appointment_time),
-                   service_type, design_director, department, 
-                   CASE WHEN is_first_time THEN '是' ELSE '否' END,
-                   amount, notes
-            FROM appointments
+        query.prepare(f"""
+            SELECT {LISTING_COLUMNS}
+            FROM {self.listing_source()}
             WHERE customer_name LIKE ? OR phone LIKE ?
             ORDER BY appointment_time
         """)
         query.addBindValue(f"%{keyword}%")
         query.addBindValue(f"%{keyword}%")
 
-        self.appointment_table.setRowCount(0)
-        if query.exec():
-            while query.next():
-                row = self.appointment_table.rowCount()
-                self.appointment_table.insertRow(row)
-                for col in range(13):
-                    item = QTableWidgetItem(str(query.value(col)))
-                    if col == 11:  # 金额列右对齐
-                        item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-                    elif col == 5 or col ==4:
-                        item = QTableWidgetItem(str(self.decrypt(query.value(col))))
-                    self.appointment_table.setItem(row, col, item)
-
-            self.show_status(f"找到 {self.appointment_table.rowCount()} 条结果", "info")
+        with instrumentation.span("db.query"):
+            ok = query.exec()
+        if ok:
+            self.populate_table(query)
+            self.show_status(f"找到 {self.table_model.rowCount()} 条结果", "info")
         else:
+            self.table_model.clear()
             self.show_status("搜索失败", "error")
 
+    def reload_table(self):
+        """按当前搜索条件重新加载表格"""
+        if self.search_input.text().strip():
+            self.search_appointments()
+        else:
+            self.refresh_table()
+
     def delayed_search(self):
         """延时搜索"""
         QTimer.singleShot(300, self.search_appointments)
@@ -694,40 +2699,34 @@ class AppointmentSystem(QMainWindow):
 
     def refresh_table(self):
         """刷新表格数据"""
-        self.appointment_table.setRowCount(0)
-        query = QSqlQuery("SELECT COUNT(*) FROM appointments")
+        source = self.listing_source()
+        query = QSqlQuery(f"SELECT COUNT(*) FROM {source}")
         if query.next():
             self.statusBar().showMessage(f"就绪 | 总预约数: {query.value(0)}")
 
-        query.exec("""
-            SELECT id, customer_name, gender, age, id_number,
-                   phone, strftime('%Y-%m-%d %H:%M', appointment_time),
-                   service_type, design_director, department, 
-                   CASE WHEN is_first_time THEN '是' ELSE '否' END,
-                   amount, notes
-            FROM appointments 
-            ORDER BY appointment_time
-        """)
+        with instrumentation.span("db.query"):
+            query.exec(f"""
+                SELECT {LISTING_COLUMNS}
+                FROM {source} 
+                ORDER BY appointment_time
+            """)
+        self.populate_table(query)
 
-        while query.next():
-            row = self.appointment_table.rowCount()
-            self.appointment_table.insertRow(row)
-            for col in range(13):
-                item = QTableWidgetItem(str(query.value(col)))
-                if col == 11:  # 金额列右对齐
-                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-                elif col == 5 or col == 4:
-                    item = QTableWidgetItem(str(self.decrypt(query.value(col))))
-                self.appointment_table.setItem(row, col, item)
-
-        # 设置时间状态颜色
-        current_time = QDateTime.currentDateTime()
-        for row in range(self.appointment_table.rowCount()):
-            time_item = self.appointment_table.item(row, 6)  # 预约时间列
-            appointment_time = QDateTime.fromString(time_item.text(), "yyyy-MM-dd HH:mm")
-            if appointment_time < current_time:
-                time_item.setForeground(QColor("#ff6b6b"))
-                time_item.setToolTip("已过期预约")
+    def populate_table(self, query):
+        """把查询结果装入列式结果集；脱敏模式下身份证号和电话只显示尾号，不做解密
+
+        已过期预约和归档记录的着色由表格模型负责。
+        """
+        with instrumentation.span("table.populate"):
+            result = AppointmentResultSet.from_query(query, self.mask_check.isChecked(), self.decrypt)
+            self.table_model.set_result(result)
+        instrumentation.count("rows.fetched", len(result))
+
+    def reveal_selected_row(self):
+        """显示当前行的身份证号和联系电话明文"""
+        row = self.current_row()
+        if row != -1:
+            self.table_model.reveal(row)
 
     def clear_form(self):
         """清空输入表单"""
@@ -756,12 +2755,22 @@ class AppointmentSystem(QMainWindow):
 
     def closeEvent(self, event):
         """关闭窗口时关闭数据库连接"""
+        self.submission_queue.shutdown()
+        self.backup_manager.shutdown()
+        self.reminder_timer.stop()
+        self.reminder_worker.cancel()
+        self.reminder_thread.quit()
+        self.reminder_thread.wait()
         self.db.close()
         event.accept()
 
     def show_edit_dialog(self, row):
+        if self.table_model.is_archived(row):
+            QMessageBox.warning(self, "警告", "历史归档记录为只读，不能编辑！")
+            return
+
         # 获取记录ID
-        record_id = int(self.appointment_table.item(row, 0).text())
+        record_id = self.table_model.record_id(row)
 
         # 从数据库获取完整数据
         query = QSqlQuery()
@@ -776,7 +2785,7 @@ class AppointmentSystem(QMainWindow):
         for i in range(13):
             val = query.value(i)
             if i == 4 or i == 5:
-                val = self.decrypt(val)
+                val = decrypt_or_placeholder(self.decrypt, val)
             data.append(val)
         data[10] = "是" if data[10] else "否"  # 转换首次登记状态
 
@@ -810,7 +2819,7 @@ class AppointmentSystem(QMainWindow):
                     customer_name = ?, gender = ?, age = ?, id_number = ?,
                     phone = ?, appointment_time = ?, service_type = ?,
                     design_director = ?, department = ?, is_first_time = ?,
-                    amount = ?, notes = ?
+                    amount = ?, notes = ?, id_suffix = ?, phone_suffix = ?
                 WHERE id = ?
             """)
             params = [
@@ -818,12 +2827,15 @@ class AppointmentSystem(QMainWindow):
                 self.encrypt(new_data["id_number"]), self.encrypt(new_data["phone"]), new_data["time"],
                 new_data["service"], new_data["designer"], new_data["dept"],
                 new_data["is_first"], new_data["amount"], new_data["notes"],
+                new_data["id_number"][-SUFFIX_LENGTH:], new_data["phone"][-SUFFIX_LENGTH:],
                 record_id
             ]
             for value in params:
                 query.addBindValue(value)
 
-            if query.exec():
+            with instrumentation.span("db.update"):
+                ok = query.exec()
+            if ok:
                 self.refresh_table()
                 self.show_status("更新成功！", "success")
             else:
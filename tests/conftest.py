@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app():
+    """整个测试会话共用一个 QApplication（无界面平台）"""
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
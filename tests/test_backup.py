@@ -0,0 +1,87 @@
+"""主库与归档库成对备份、校验、恢复和轮转"""
+import glob
+import gzip
+import os
+import sqlite3
+
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("Crypto")
+
+import qianmei
+from qianmei import BackupManager, list_snapshots, rotate_snapshots, take_snapshot
+
+
+def make_db(path, ids):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS appointments (id INTEGER PRIMARY KEY, customer_name TEXT)")
+    conn.execute("DELETE FROM appointments")
+    conn.executemany("INSERT INTO appointments VALUES (?, ?)", [(i, f"客户{i}") for i in ids])
+    conn.commit()
+    conn.close()
+
+
+def ids(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute("SELECT id FROM appointments ORDER BY id")]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    monkeypatch.setattr(qianmei, "BACKUP_COMPRESS", True)
+    main, archive = str(tmp_path / "qianmei.db"), str(tmp_path / "qianmei_archive.db")
+    make_db(main, [3, 4, 5])
+    make_db(archive, [1, 2])
+    return main, archive, str(tmp_path / "backups")
+
+
+@pytest.fixture
+def manager(app, stores):
+    manager = BackupManager(*stores)
+    manager.stop_schedule()
+    yield manager
+    manager.shutdown()
+
+
+def test_snapshot_writes_compressed_pair(stores):
+    main, archive, backup_dir = stores
+    path = take_snapshot(main, archive, backup_dir, "20200101-000000")
+    assert os.path.basename(path) == "qianmei-20200101-000000.db.gz"
+    assert sorted(os.listdir(backup_dir)) == ["qianmei-20200101-000000.db.gz",
+                                              "qianmei_archive-20200101-000000.db.gz"]
+
+
+def test_verify_checks_archive_snapshot(stores, manager):
+    main, archive, backup_dir = stores
+    path = take_snapshot(main, archive, backup_dir, "20200101-000000")
+    assert manager.archive_snapshot(path) == os.path.join(backup_dir, "qianmei_archive-20200101-000000.db.gz")
+    assert manager.verify(path) == (True, 3)
+
+    with gzip.open(manager.archive_snapshot(path), "wb") as f:
+        f.write(b"not a database")
+    ok, detail = manager.verify(path)
+    assert not ok
+    assert detail.startswith("归档库快照")
+
+
+def test_restore_and_rotate_keep_pairs(stores, manager, monkeypatch):
+    main, archive, backup_dir = stores
+    path = take_snapshot(main, archive, backup_dir, "20200101-000000")
+    make_db(main, [5, 6])
+    make_db(archive, [1, 2, 3, 4])
+
+    safety = manager.restore(path)
+    assert ids(main) == [3, 4, 5]
+    assert ids(archive) == [1, 2]
+    assert safety.endswith("-before-restore.db.gz")
+    assert manager.archive_snapshot(safety)
+    assert list_snapshots(backup_dir) == [safety, path]
+
+    monkeypatch.setattr(qianmei, "BACKUP_KEEP", 1)
+    rotate_snapshots(backup_dir)
+    assert list_snapshots(backup_dir) == [safety]
+    assert glob.glob(os.path.join(backup_dir, "qianmei_archive-*")) == [manager.archive_snapshot(safety)]
@@ -0,0 +1,157 @@
+"""预约提醒批处理的重试与幂等"""
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("Crypto")
+
+from PyQt5.QtSql import QSqlDatabase, QSqlQuery
+
+from qianmei import (REMINDER_RESET_TRIGGER, REMINDER_RETRY_DELAY, ReminderError, ReminderJob,
+                     ReminderSender)
+
+CONNECTION_NAME = "test_reminders"
+START, END = "2026-10-20 00:00", "2026-10-21 00:00"
+
+
+class FakeSender(ReminderSender):
+    """前 failures 次发送失败，记录每次调用"""
+    def __init__(self, failures=0, stand_in=False):
+        self.failures = failures
+        self.stand_in = stand_in
+        self.calls = []
+
+    def send(self, phone, message):
+        self.calls.append((phone, message))
+        if len(self.calls) <= self.failures:
+            raise ReminderError("网关超时")
+
+
+@pytest.fixture
+def db(app):
+    db = QSqlDatabase.addDatabase("QSQLITE", CONNECTION_NAME)
+    db.setDatabaseName(":memory:")
+    assert db.open()
+    query = QSqlQuery(db)
+    assert query.exec("""
+        CREATE TABLE appointments (
+            id INTEGER PRIMARY KEY, customer_name TEXT, phone TEXT, appointment_time DATETIME,
+            service_type TEXT, design_director TEXT, department TEXT, reminder_sent_at TEXT
+        )
+    """)
+    assert query.exec("""
+        INSERT INTO appointments VALUES
+            (1, '王芳', '11110000831', '2026-10-20 09:30', '水光针', '孙总', '仟美医疗美容', NULL),
+            (2, '李娜', '22220000931', '2026-10-21 10:00', '热玛吉', '蔡医生', '仟美医疗美容', NULL)
+    """)
+    yield db
+    query.finish()
+    db.close()
+    del db, query
+    QSqlDatabase.removeDatabase(CONNECTION_NAME)
+
+
+def decrypt(cipher_text):
+    return cipher_text[::-1]
+
+
+def make_job(db, sender, sleeps, retries=3):
+    return ReminderJob(db, decrypt, sender, min_interval=0, retries=retries, sleep=sleeps.append)
+
+
+def sent_at(db, record_id):
+    query = QSqlQuery(db)
+    query.prepare("SELECT reminder_sent_at FROM appointments WHERE id = ?")
+    query.addBindValue(record_id)
+    assert query.exec() and query.next()
+    return query.value(0)
+
+
+def test_retries_with_backoff_then_marks_sent(db):
+    sender, sleeps = FakeSender(failures=2), []
+    assert make_job(db, sender, sleeps).run(START, END) == (1, 0)
+    assert len(sender.calls) == 3
+    phone, message = sender.calls[-1]
+    assert phone == "13800001111"
+    assert message.startswith("王芳您好，您预约的水光针将于2026-10-20 09:30在仟美医疗美容进行（孙总）")
+    assert sum(sleeps) == pytest.approx(REMINDER_RETRY_DELAY * 3)
+    assert sent_at(db, 1)
+    assert not sent_at(db, 2)  # 不在时间段内
+
+
+def test_exhausted_retries_leave_row_unsent(db):
+    sender, sleeps = FakeSender(failures=10), []
+    assert make_job(db, sender, sleeps, retries=2).run(START, END) == (0, 1)
+    assert len(sender.calls) == 3
+    assert not sent_at(db, 1)
+
+
+def test_rerun_sends_nothing_twice(db):
+    sender = FakeSender()
+    assert make_job(db, sender, []).run(START, END) == (1, 0)
+    assert make_job(db, sender, []).run(START, END) == (0, 0)
+    assert len(sender.calls) == 1
+
+
+def test_stand_in_sender_does_not_mark_sent(db):
+    preview = FakeSender(stand_in=True)
+    assert make_job(db, preview, []).run(START, END) == (1, 0)
+    assert not sent_at(db, 1)
+
+    sender = FakeSender()
+    assert make_job(db, sender, []).run(START, END) == (1, 0)
+    assert len(sender.calls) == 1
+
+
+def test_undecryptable_phone_is_skipped(db):
+    query = QSqlQuery(db)
+    assert query.exec("""
+        INSERT INTO appointments VALUES
+            (3, '张敏', 'broken', '2026-10-20 11:00', '光子嫩肤', '孙总', '仟美医疗美容', NULL)
+    """)
+
+    def strict_decrypt(cipher_text):
+        if cipher_text == "broken":
+            raise ValueError("Padding is incorrect.")
+        return decrypt(cipher_text)
+
+    sender = FakeSender()
+    job = ReminderJob(db, strict_decrypt, sender, min_interval=0, sleep=lambda seconds: None)
+    assert job.run(START, END) == (1, 1)
+    assert [phone for phone, _ in sender.calls] == ["13800001111"]
+    assert sent_at(db, 1)
+    assert not sent_at(db, 3)
+
+
+def test_cancel_interrupts_retry_wait(db):
+    sender, sleeps = FakeSender(failures=10), []
+    job = make_job(db, sender, sleeps)
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        job.cancelled = True
+
+    job.sleep = sleep
+    assert job.run(START, END) == (0, 1)
+    assert len(sender.calls) == 1
+    assert len(sleeps) == 1
+    assert not sent_at(db, 1)
+
+
+def test_rescheduling_clears_sent_flag(db):
+    query = QSqlQuery(db)
+    assert query.exec(REMINDER_RESET_TRIGGER)
+    assert make_job(db, FakeSender(), []).run(START, END) == (1, 0)
+
+    assert query.exec("UPDATE appointments SET service_type = '热玛吉' WHERE id = 1")
+    assert sent_at(db, 1)
+    assert query.exec("UPDATE appointments SET appointment_time = '2026-10-20 15:00' WHERE id = 1")
+    assert not sent_at(db, 1)
+
+    sender = FakeSender()
+    assert make_job(db, sender, []).run(START, END) == (1, 0)
+    assert "2026-10-20 15:00" in sender.calls[0][1]
+
+
+def test_sender_interface_is_abstract():
+    with pytest.raises(TypeError):
+        ReminderSender()
@@ -0,0 +1,72 @@
+"""登记提交日志的重放"""
+import json
+
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("Crypto")
+
+from qianmei import SubmissionQueue
+
+
+@pytest.fixture
+def make_queue(app, tmp_path):
+    queues = []
+
+    def make():
+        queue = SubmissionQueue(str(tmp_path / "pending.jsonl"), str(tmp_path / "qianmei.db"))
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.shutdown()
+
+
+def write_journal(tmp_path, entries, tail=""):
+    with open(tmp_path / "pending.jsonl", "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.write(tail)
+
+
+def add(key):
+    return {"op": "add", "key": key, "record": {"customer_name": f"客户{key}"}}
+
+
+def test_replay_skips_torn_last_line(make_queue, tmp_path):
+    write_journal(tmp_path, [add("k1"), add("k2"), {"op": "done", "keys": ["k1"]}],
+                  tail='{"op": "add", "key": "k3", "rec')
+    queue = make_queue()
+    assert queue.replay() == 1
+    assert list(queue.pending) == ["k2"]
+    assert queue.pending["k2"] == {"customer_name": "客户k2"}
+
+
+def test_replay_keeps_add_without_done(make_queue, tmp_path):
+    write_journal(tmp_path, [add("k1"), add("k2"), add("k3"), {"op": "done", "keys": ["k2"]}])
+    queue = make_queue()
+    assert queue.replay() == 2
+    assert list(queue.pending) == ["k1", "k3"]
+
+
+def test_replay_compacts_when_everything_done(make_queue, tmp_path):
+    write_journal(tmp_path, [add("k1"), add("k2"), {"op": "done", "keys": ["k1", "k2"]}])
+    queue = make_queue()
+    assert queue.replay() == 0
+    assert not queue.pending
+    assert (tmp_path / "pending.jsonl").read_text(encoding="utf-8") == ""
+
+
+def test_replay_without_journal(make_queue):
+    assert make_queue().replay() == 0
+
+
+def test_submitted_record_survives_restart(make_queue):
+    first = make_queue()
+    key = first.submit({"customer_name": "张三"})
+    first.shutdown()  # 模拟写库之前退出
+
+    second = make_queue()
+    assert second.replay() == 1
+    assert second.pending[key] == {"customer_name": "张三"}
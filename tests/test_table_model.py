@@ -0,0 +1,101 @@
+"""排序后显示行与记录的对应关系"""
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("Crypto")
+
+from PyQt5.QtCore import Qt
+
+from qianmei import UNDECRYPTABLE_TEXT, AppointmentResultSet, AppointmentTableModel
+
+# (ID, 姓名, 年龄, 身份证号, 联系电话, 预约时间, 金额, 已归档)
+RECORDS = [
+    (11, "王芳", 35, "110101199001011234", "13800001111", "2026-10-21 09:30", "800", 0),
+    (12, "李娜", 28, "310104199502025678", "13900002222", "2026-10-20 14:00", "12000", 1),
+    (13, "张敏", 42, "440103198303039012", "15000003333", "2026-10-22 10:15", "3500", 0),
+]
+
+
+def decrypt(cipher_text):
+    """测试用“密文”为明文倒序，“损坏”的密文解密失败"""
+    if cipher_text == "broken":
+        raise ValueError("Padding is incorrect.")
+    return cipher_text[::-1]
+
+
+def make_result(records=RECORDS, masked=True):
+    result = AppointmentResultSet(masked, decrypt)
+    for record_id, name, age, id_number, phone, time, amount, archived in records:
+        result.append([
+            record_id, name, "女", age, id_number[::-1], phone[::-1], time,
+            "水光针", "孙总", "仟美医疗美容", 1, amount, "", archived,
+            id_number[-4:], phone[-4:],
+        ])
+    return result
+
+
+@pytest.fixture
+def model(app):
+    model = AppointmentTableModel(decrypt)
+    model.set_result(make_result())
+    return model
+
+
+def record_ids(model):
+    return [model.record_id(row) for row in range(model.rowCount())]
+
+
+def test_unsorted_rows_follow_query_order(model):
+    assert record_ids(model) == [11, 12, 13]
+
+
+@pytest.mark.parametrize("column, order, expected", [
+    (3, Qt.AscendingOrder, [12, 11, 13]),  # 年龄
+    (3, Qt.DescendingOrder, [13, 11, 12]),
+    (6, Qt.AscendingOrder, [12, 11, 13]),  # 预约时间
+    (11, Qt.DescendingOrder, [12, 13, 11]),  # 金额按数值
+    (1, Qt.AscendingOrder, sorted([11, 12, 13], key={11: "王芳", 12: "李娜", 13: "张敏"}.get)),
+])
+def test_sort_maps_rows_to_records(model, column, order, expected):
+    model.sort(column, order)
+    assert record_ids(model) == expected
+    for row, record_id in enumerate(expected):
+        assert model.data(model.index(row, 0)) == str(record_id)
+        assert model.is_archived(row) == (record_id == 12)
+
+
+def test_new_result_keeps_sort(model):
+    model.sort(3, Qt.DescendingOrder)
+    model.set_result(make_result(RECORDS[::-1]))
+    assert record_ids(model) == [13, 11, 12]
+
+
+def test_cell_text_and_reveal_use_sorted_row(model):
+    model.sort(3, Qt.DescendingOrder)  # 张敏、王芳、李娜
+    assert model.data(model.index(1, 5)) == "*******1111"
+    assert model.cell_text(1, 5) == "13800001111"
+    assert model.data(model.index(1, 5)) == "*******1111"  # 复制不改变显示
+
+    model.reveal(2)
+    assert model.data(model.index(2, 4)) == "310104199502025678"
+    assert model.data(model.index(2, 5)) == "13900002222"
+    assert model.data(model.index(0, 4)) == "**************9012"
+
+
+def test_undecryptable_row_shows_placeholder(app):
+    broken = "broken"[::-1]  # make_result 存入倒序后即为损坏的密文
+    record = (14, "刘洁", 30, broken, broken, "2026-10-23 16:00", "500", 0)
+    masked = AppointmentTableModel(decrypt)
+    result = make_result(RECORDS + [record])
+    result.id_suffixes[3] = result.phone_suffixes[3] = ""  # 尾号补写时跳过了这一行
+    masked.set_result(result)
+    assert masked.data(masked.index(3, 4)) == "*" * 18
+    assert masked.cell_text(3, 5) == UNDECRYPTABLE_TEXT
+    masked.reveal(3)
+    assert masked.data(masked.index(3, 4)) == UNDECRYPTABLE_TEXT
+    assert masked.data(masked.index(0, 4)) == "**************1234"
+
+    plain = AppointmentTableModel(decrypt)
+    plain.set_result(make_result(RECORDS + [record], masked=False))
+    assert plain.data(plain.index(3, 5)) == UNDECRYPTABLE_TEXT
+    assert plain.data(plain.index(0, 5)) == "13800001111"